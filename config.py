@@ -6,25 +6,40 @@ LightKeyia - Configuration et constantes
 import os
 import logging
 import sys
+import queue
+import atexit
+import importlib.util
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
 # Version
 VERSION = "1.4.0"
 
 # Configure logging
+# Les écritures console et fichier se font dans le thread du QueueListener :
+# les threads de traitement ne font qu'empiler l'enregistrement, sans attendre les E/S
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_handlers = [logging.StreamHandler(sys.stdout), logging.FileHandler("lightkeyia.log", mode="a")]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Vider la file avant la sortie
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout), logging.FileHandler("lightkeyia.log", mode="a")]
+    format='%(message)s',  # Mise en forme complète par les handlers du listener
+    handlers=[QueueHandler(_log_queue)]
 )
 logger = logging.getLogger("LightKeyia")
 
-# Extensions de fichiers
-IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif', '.heic', '.heif',
-                   '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2', '.raf', '.orf', '.rw2',
-                   '.pef', '.dng', '.raw', '.rwl', '.iiq', '.3fr', '.x3f')
-RAW_EXTENSIONS = ('.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2', '.raf', '.orf', '.rw2',
-                 '.pef', '.dng', '.raw', '.rwl', '.iiq', '.3fr', '.x3f')
+# Extensions de fichiers (frozenset pour des tests d'appartenance en O(1))
+IMAGE_EXTENSIONS = frozenset(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif', '.heic', '.heif',
+                              '.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2', '.raf', '.orf', '.rw2',
+                              '.pef', '.dng', '.raw', '.rwl', '.iiq', '.3fr', '.x3f'))
+RAW_EXTENSIONS = frozenset(('.cr2', '.cr3', '.nef', '.nrw', '.arw', '.srf', '.sr2', '.raf', '.orf', '.rw2',
+                            '.pef', '.dng', '.raw', '.rwl', '.iiq', '.3fr', '.x3f'))
 
 # URLs pour Ollama
 DEFAULT_OLLAMA_URL = "http://localhost:11434"
@@ -39,16 +54,39 @@ DEFAULT_MAX_CONCURRENT_REQUESTS = 3
 # Répertoire de cache
 CACHE_DIR = os.path.join(os.path.expanduser("~"), ".lightkeyia_cache")
 os.makedirs(CACHE_DIR, exist_ok=True)
+RESPONSE_CACHE_MAX_ENTRIES = 5000  # Nombre maximum de réponses Ollama conservées sur disque
+PREVIEW_CACHE_MAX_ENTRIES = 2000  # Nombre maximum d'aperçus réduits (JPEG) conservés sur disque
 
 # Vérification des dépendances optionnelles
-try:
-    import rawpy
-    RAWPY_AVAILABLE = True
+# rawpy (LibRaw et numpy) est lourd à importer : on vérifie seulement qu'il est installé,
+# l'import réel est fait à la première conversion RAW (imports locaux dans utils et ollama_client)
+RAWPY_AVAILABLE = importlib.util.find_spec("rawpy") is not None
+if RAWPY_AVAILABLE:
     logger.info("rawpy is available for RAW file processing")
-except ImportError:
-    RAWPY_AVAILABLE = False
+else:
     logger.warning("rawpy is not available. RAW processing will be limited.")
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    logger.info("orjson is available for fast JSON serialization")
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+    logger.info("pybase64 is available for fast image encoding")
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+try:
+    import piexif
+    PIEXIF_AVAILABLE = True
+    logger.info("piexif is available for writing JPG metadata without ExifTool")
+except ImportError:
+    PIEXIF_AVAILABLE = False
+
 # Vérification d'ExifTool
 try:
     import subprocess
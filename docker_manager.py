@@ -16,6 +16,8 @@ class DockerManager:
     def __init__(self):
         self.docker_available = self._check_docker_available()
         self.logger = logger
+        # Session HTTP partagée : les vérifications répétées des instances réutilisent les connexions
+        self.session = requests.Session()
     
     def _check_docker_available(self):
         """Vérifier si Docker est disponible sur le système"""
@@ -114,8 +116,11 @@ class DockerManager:
             logger.error(f"Erreur lors de la liste des conteneurs: {str(e)}")
             return []
     
-    def create_ollama_container(self, name, port, volume_name=None, use_network=True):
-        """Créer un nouveau conteneur Ollama"""
+    def create_ollama_container(self, name, port, volume_name=None, use_network=True, gpu_index=None):
+        """Créer un nouveau conteneur Ollama
+        
+        gpu_index : réserver une seule GPU au conteneur (toutes les GPU si None)
+        """
         if not self.docker_available:
             return False, "Docker n'est pas disponible"
         
@@ -155,7 +160,7 @@ class DockerManager:
         
             # Ajouter des options pour la GPU si disponible
             if self._check_gpu_available():
-                cmd.extend(["--gpus", "all"])
+                cmd.extend(["--gpus", f"device={gpu_index}" if gpu_index is not None else "all"])
         
             cmd.append("ollama/ollama")
         
@@ -240,7 +245,7 @@ class DockerManager:
     def check_ollama_api(self, url):
         """Vérifier si l'API Ollama est accessible à l'URL spécifiée"""
         try:
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=5)
             return response.status_code == 200
         except:
             return False
@@ -248,7 +253,7 @@ class DockerManager:
     def check_model_available(self, url, model_name):
         """Vérifier si un modèle spécifique est disponible sur l'instance Ollama"""
         try:
-            response = requests.get(f"{url}/api/tags", timeout=10)
+            response = self.session.get(f"{url}/api/tags", timeout=10)
             if response.status_code == 200:
                 models = response.json().get('models', [])
                 for model in models:
@@ -261,7 +266,7 @@ class DockerManager:
     def pull_model(self, url, model_name):
         """Télécharger un modèle sur une instance Ollama"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{url}/api/pull",
                 json={"name": model_name},
                 timeout=600  # Timeout plus long pour le téléchargement
@@ -297,9 +302,26 @@ class DockerManager:
         except:
             return False
     
+    def _count_gpus(self):
+        """Compter les GPU NVIDIA visibles (0 si nvidia-smi est absent)"""
+        try:
+            result = subprocess.run(
+                ["nvidia-smi", "-L"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            if result.returncode != 0:
+                return 0
+            return sum(1 for line in result.stdout.splitlines() if line.startswith("GPU "))
+        except Exception:
+            return 0
+    
     def create_multiple_containers(self, base_name, start_port, count, use_network=True):
-        """Créer plusieurs conteneurs Ollama"""
+        """Créer plusieurs conteneurs Ollama
+        
+        Avec plusieurs GPU, chaque conteneur reçoit sa propre GPU (répartition circulaire) au lieu
+        de partager toutes les GPU : les instances ne se disputent plus la même mémoire vidéo.
+        """
         results = []
+        gpu_count = self._count_gpus()
         
         # Créer le réseau si nécessaire et si demandé
         if use_network:
@@ -310,7 +332,8 @@ class DockerManager:
         for i in range(count):
             name = f"{base_name}{i+1}"
             port = start_port + i
-            success, message = self.create_ollama_container(name, port, use_network=use_network)
+            gpu_index = i % gpu_count if gpu_count > 1 else None
+            success, message = self.create_ollama_container(name, port, use_network=use_network, gpu_index=gpu_index)
             results.append({
                 "name": name,
                 "port": port,
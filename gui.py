@@ -71,8 +71,8 @@ class ImageProcessorGUI:
         self.max_concurrent_requests_var = tk.IntVar(value=DEFAULT_MAX_CONCURRENT_REQUESTS)
         
         # Variables pour le contrôle des logs
-        self.displayed_logs = set()  # Pour suivre les logs déjà affichés
-        self.update_timer = None     # Pour suivre le timer de mise à jour
+        self.log_cursor = None       # Curseur des logs déjà affichés (voir ImageProcessor.get_progress)
+        self.last_progress_view = None  # Dernières valeurs affichées, pour ne toucher les widgets qu'en cas de changement
         self.is_processing = False   # Pour suivre l'état du traitement
         
         # Ajouter une variable pour le mode cloud
@@ -94,9 +94,11 @@ class ImageProcessorGUI:
         # Initial model refresh
         self.refresh_models()
         
-        # Start progress update thread
-        self.progress_thread = threading.Thread(target=self.update_progress, daemon=True)
-        self.progress_thread.start()
+        # Mise à jour de la progression par la boucle Tk (pas de thread de sondage)
+        self.root.after(500, self.progress_tick)
+        
+        # Terminer proprement les écritures en attente à la fermeture de la fenêtre
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
         # Start resource monitoring thread
         self.resource_thread = threading.Thread(target=self.monitor_resources, daemon=True)
@@ -456,7 +458,7 @@ Pour utiliser uniquement Ollama local, assurez-vous que l'URL "http://localhost:
         # Stratégie de répartition de charge
         ttk.Label(instances_frame, text="Load Balancing Strategy:").pack(anchor=tk.W, pady=5)
         
-        strategies = ["round_robin", "least_busy", "fastest", "random", "health_based"]
+        strategies = ["round_robin", "weighted_round_robin", "least_busy", "fastest", "random", "health_based", "prefix"]
         strategy_combo = ttk.Combobox(instances_frame, textvariable=self.load_balancing_strategy_var, values=strategies)
         strategy_combo.pack(fill=tk.X, pady=2)
         
@@ -467,10 +469,12 @@ Pour utiliser uniquement Ollama local, assurez-vous que l'URL "http://localhost:
         strategies_text = scrolledtext.ScrolledText(strategies_frame, height=8, wrap=tk.WORD)
         strategies_text.pack(fill=tk.BOTH, expand=True)
         strategies_text.insert(tk.END, """round_robin: Distributes requests evenly across all instances in sequence.
-least_busy: Sends requests to the instance with the fewest active requests.
-fastest: Selects the instance with the lowest average response time.
+weighted_round_robin: Interleaves requests in proportion to each instance's recent speed.
+least_busy: Sends requests to the instance with the least outstanding work (active and queued requests x recent response time).
+fastest: Selects the instance with the shortest expected wait (recent response time x queue).
 random: Randomly selects an instance for each request.
-health_based: Selects instances based on a comprehensive health score (recommended).""")
+health_based: Selects instances based on a comprehensive health score (recommended).
+prefix: Keeps requests sharing a system prompt on the same instance to reuse its prompt cache, spilling over when it is busier than 1.25x the average.""")
         strategies_text.config(state=tk.DISABLED)
         
         # Boutons pour gérer les instances
@@ -763,7 +767,8 @@ health_based: Selects instances based on a comprehensive health score (recommend
             # Vérifier si les URLs ont changé
             current_urls = [instance.url for instance in self.processor.ollama_client.instances]
             if set(current_urls) != set(ollama_urls):
-                # Recréer le client Ollama avec les nouvelles URLs
+                # Recréer le client Ollama avec les nouvelles URLs (en fermant les connexions de l'ancien)
+                self.processor.ollama_client.close()
                 self.processor.ollama_client = OllamaClient(ollama_urls)
                 self.processor.ollama_client.max_concurrent_requests = self.processor.max_concurrent_requests
                 self.processor.ollama_client.load_balancing_strategy = self.processor.load_balancing_strategy
@@ -792,6 +797,15 @@ health_based: Selects instances based on a comprehensive health score (recommend
         # Mettre à jour l'affichage des instances
         self.update_instances_status()
     
+    def on_closing(self):
+        """Fermer le processeur (écritures de métadonnées en attente) puis la fenêtre"""
+        if self.processor:
+            try:
+                self.processor.close()
+            except Exception as e:
+                logger.error(f"Error closing processor: {str(e)}")
+        self.root.destroy()
+    
     def check_instances(self):
         """Vérifier la disponibilité des instances Ollama"""
         if not self.processor:
@@ -802,7 +816,7 @@ health_based: Selects instances based on a comprehensive health score (recommend
         
         # Vérifier les instances dans un thread séparé
         def check_thread():
-            self.processor.ollama_client._check_instances()
+            self.processor.ollama_client._check_instances(force=True)
             self.root.after(0, self.update_instances_status)
         
         threading.Thread(target=check_thread, daemon=True).start()
@@ -1125,9 +1139,10 @@ health_based: Selects instances based on a comprehensive health score (recommend
     def clear_logs(self):
         """Effacer les logs de l'interface"""
         self.log_text.delete(1.0, tk.END)
-        self.displayed_logs.clear()
+        self.log_cursor = None
         if self.processor:
             self.processor.logs.clear()
+            self.log_cursor = self.processor.get_progress()["logCursor"]
     
     def start_processing(self):
         directory = self.dir_entry.get()
@@ -1174,29 +1189,15 @@ health_based: Selects instances based on a comprehensive health score (recommend
     def process_directory(self, directory):
         """Traiter un répertoire d'images"""
         try:
-            # Configurer un timer pour forcer la mise à jour de la progression toutes les secondes
-            def schedule_update():
-                if self.is_processing:
-                    self.force_update_progress()
-                    self.update_timer = self.root.after(1000, schedule_update)
-        
-        # Démarrer le timer de mise à jour
-            self.update_timer = self.root.after(1000, schedule_update)
-        
-        # Traiter le répertoire
+        # Traiter le répertoire (progress_tick met l'interface à jour pendant ce temps)
             self.processor.process_directory(directory, recursive=self.recursive_var.get())
-        
-        # Arrêter le timer de mise à jour
-            if self.update_timer:
-                self.root.after_cancel(self.update_timer)
-                self.update_timer = None
             
-        # Forcer une dernière mise à jour
-            self.force_update_progress()
-        
-        # Ajouter un message de fin de traitement
-            self.log_text.insert(tk.END, "--- Processing completed ---\n")
-            self.log_text.see(tk.END)
+        # Forcer une dernière mise à jour, puis ajouter un message de fin de traitement (sur le thread Tk)
+            def finish_update():
+                self.force_update_progress()
+                self.log_text.insert(tk.END, "--- Processing completed ---\n")
+                self.log_text.see(tk.END)
+            self.root.after(0, finish_update)
         finally:
         # Marquer la fin du traitement
             self.is_processing = False
@@ -1213,10 +1214,6 @@ health_based: Selects instances based on a comprehensive health score (recommend
     def stop_processing(self):
         if self.processor:
             self.processor.stop_processing()
-            # Arrêter le timer de mise à jour
-            if self.update_timer:
-                self.root.after_cancel(self.update_timer)
-                self.update_timer = None
     
     def clear_cache(self):
         if self.processor:
@@ -1228,16 +1225,7 @@ health_based: Selects instances based on a comprehensive health score (recommend
     def force_update_progress(self):
         """Force la mise à jour de la barre de progression"""
         if self.processor:
-            progress = self.processor.get_progress()
-            self.progress_var.set(progress["progress"])
-            self.status_label.config(text=progress["status"].capitalize())
-            images_text = f"{progress['processed'] + progress['skipped'] + progress['failed']}/{progress['total']} (Processed: {progress['processed']}, Skipped: {progress['skipped']}, Failed: {progress['failed']})"
-            self.images_label.config(text=images_text)
-            time_text = f"{progress['timeElapsed']} / {progress['timeRemaining']}"
-            self.time_label.config(text=time_text)
-            
-            # Mettre à jour les logs sans duplication
-            self.update_logs(progress["logs"])
+            self.refresh_progress()
             
             # Mettre à jour les statistiques des instances
             self.update_instances_stats()
@@ -1245,17 +1233,30 @@ health_based: Selects instances based on a comprehensive health score (recommend
             # Forcer la mise à jour de l'interface
             self.root.update_idletasks()
     
-    def update_logs(self, logs):
-        """Mettre à jour les logs sans duplication"""
-        for log in logs:
-            if log and log not in self.displayed_logs:
-                self.log_text.insert(tk.END, log + "\n")
-                self.displayed_logs.add(log)
+    def refresh_progress(self):
+        """Afficher la progression et les nouveaux logs (thread Tk uniquement)"""
+        progress = self.processor.get_progress(self.log_cursor)
+        self.log_cursor = progress["logCursor"]
         
-        # Limiter la taille de l'ensemble des logs affichés
-        if len(self.displayed_logs) > 1000:
-            # Garder seulement les 500 derniers logs
-            self.displayed_logs = set(list(self.displayed_logs)[-500:])
+        images_text = f"{progress['processed'] + progress['skipped'] + progress['failed']}/{progress['total']} (Processed: {progress['processed']}, Skipped: {progress['skipped']}, Failed: {progress['failed']})"
+        time_text = f"{progress['timeElapsed']} / {progress['timeRemaining']}"
+        view = (progress["progress"], progress["status"], images_text, time_text)
+        
+        # Ne reconfigurer les widgets que si une valeur a changé
+        if view != self.last_progress_view:
+            self.progress_var.set(progress["progress"])
+            self.status_label.config(text=progress["status"].capitalize())
+            self.images_label.config(text=images_text)
+            self.time_label.config(text=time_text)
+            self.last_progress_view = view
+        
+        # Seuls les logs ajoutés depuis le dernier affichage sont reçus
+        self.update_logs(progress["logs"])
+    
+    def update_logs(self, logs):
+        """Ajouter les nouveaux logs en une seule insertion"""
+        if logs:
+            self.log_text.insert(tk.END, "".join(f"{log}\n" for log in logs if log))
         
         # Défiler vers le bas
         self.log_text.see(tk.END)
@@ -1347,40 +1348,15 @@ health_based: Selects instances based on a comprehensive health score (recommend
             # Update every 2 seconds
             time.sleep(2)
     
-    def update_progress(self):
-        """Thread pour mettre à jour la progression en temps réel"""
-        while True:
-            try:
-                # Ne mettre à jour que si nous sommes en cours de traitement
-                # et que le timer de mise à jour forcée n'est pas actif
-                if self.processor and self.is_processing and not self.update_timer:
-                    progress = self.processor.get_progress()
-                    
-                    # Mettre à jour la barre de progression sur le thread principal
-                    self.root.after(0, lambda p=progress["progress"]: self.progress_var.set(p))
-                    
-                    # Mettre à jour le statut sur le thread principal
-                    self.root.after(0, lambda s=progress["status"].capitalize(): self.status_label.config(text=s))
-                    
-                    # Mettre à jour le compteur d'images sur le thread principal
-                    images_text = f"{progress['processed'] + progress['skipped'] + progress['failed']}/{progress['total']} (Processed: {progress['processed']}, Skipped: {progress['skipped']}, Failed: {progress['failed']})"
-                    self.root.after(0, lambda t=images_text: self.images_label.config(text=t))
-                    
-                    # Mettre à jour le temps sur le thread principal
-                    time_text = f"{progress['timeElapsed']} / {progress['timeRemaining']}"
-                    self.root.after(0, lambda t=time_text: self.time_label.config(text=t))
-                    
-                    # Mettre à jour les logs sur le thread principal
-                    self.root.after(0, lambda l=progress["logs"]: self.update_logs(l))
-                    
-                    # Forcer la mise à jour de l'interface
-                    self.root.after(0, self.root.update_idletasks)
-            except Exception as e:
-                # Éviter que les erreurs ne bloquent la boucle de mise à jour
-                print(f"Erreur dans la mise à jour de la progression: {str(e)}")
-            
-            # Pause courte pour éviter de surcharger le CPU
-            time.sleep(0.5)
+    def progress_tick(self):
+        """Mettre à jour la progression depuis la boucle Tk toutes les 500 ms pendant le traitement"""
+        try:
+            if self.processor and self.is_processing:
+                self.refresh_progress()
+        except Exception as e:
+            # Éviter que les erreurs n'interrompent la boucle de mise à jour
+            print(f"Erreur dans la mise à jour de la progression: {str(e)}")
+        self.root.after(500, self.progress_tick)
 
     # Ajouter les nouvelles méthodes pour gérer le réseau Docker et lancer les instances
     def create_docker_network(self):
@@ -4,21 +4,160 @@ LightKeyia - Processeur d'images
 """
 
 import os
+import re
 import time
 import json
 import threading
+import functools
 import concurrent.futures
-import tempfile
+from collections import deque
+from itertools import islice
+import io
 from datetime import datetime, timedelta
 from PIL import Image
+from PIL.ExifTags import TAGS
 import psutil
 
-from config import RAW_EXTENSIONS, EXIFTOOL_AVAILABLE, USER_PROMPT, DEFAULT_SYSTEM_PROMPT, DEFAULT_OLLAMA_URL, logger
+from config import IMAGE_EXTENSIONS, RAW_EXTENSIONS, EXIFTOOL_AVAILABLE, USER_PROMPT, DEFAULT_SYSTEM_PROMPT, DEFAULT_OLLAMA_URL, logger
 from utils import (_is_in_cache, _add_to_cache, has_keywords_in_xmp, clean_and_repair_json, 
-                  extract_keywords_from_json, convert_raw_to_jpeg, save_jpg_metadata_with_exiftool, 
-                  save_jpg_metadata_with_pillow, _cleanup_temp_files)
+                  extract_keywords_from_json, json_dumps, json_loads, convert_raw_to_jpeg, save_jpg_metadata_with_exiftool, 
+                  save_jpg_metadata_with_pillow, _downscale, get_preview_cache_key, load_cached_preview, save_cached_preview)
 from ollama_client import OllamaClient
 
+# Extensions JPEG (pour l'écriture des métadonnées dans le JPG)
+_JPEG_EXTENSIONS = frozenset(('.jpg', '.jpeg'))
+
+# Table d'échappement XML (un seul passage via str.translate)
+_XML_ESCAPE = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;', ord('"'): '&quot;', ord("'"): '&apos;'}
+# Contenu texte d'un élément : seuls &, < et > doivent être échappés
+_XML_TEXT_ESCAPE = {ord('&'): '&amp;', ord('<'): '&lt;', ord('>'): '&gt;'}
+
+@functools.lru_cache(maxsize=256)
+def _dir_index(dir_path):
+    """Indexer les fichiers d'un répertoire (nom en minuscules -> nom réel)
+    
+    Sert à associer RAW et JPG et à savoir sans appel système si un XMP existe. L'index est exact
+    et ne coûte qu'un scandir par dossier ; un filtre de Bloom n'économiserait rien de plus.
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return {entry.name.lower(): entry.name for entry in entries}
+    except OSError as e:
+        logger.warning(f"Cannot index directory {dir_path}: {str(e)}")
+        return {}
+
+def _exif_ratio(value):
+    """Convertir une valeur EXIF rationnelle (IFDRational, Fraction, tuple (num, den) ou nombre) en float"""
+    if isinstance(value, tuple):
+        return value[0] / value[1] if value[1] else 0.0
+    return float(value)
+
+def _iter_images(directory, recursive=True):
+    """Parcourir un répertoire avec os.scandir et produire les chemins des images
+    
+    Le type des entrées vient du parcours du répertoire (pas de stat par fichier) ; chaque chemin n'est produit qu'une fois.
+    """
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if recursive:
+                            stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield entry.path
+        except OSError as e:
+            # Comme os.walk, ignorer les répertoires illisibles
+            logger.warning(f"Cannot scan directory {current}: {str(e)}")
+
+# Contenu brut de la balise lightkeyia:keywords d'un XMP existant
+_LIGHTKEYIA_KEYWORDS_RE = re.compile(r'<lightkeyia:keywords>(.*?)</lightkeyia:keywords>', re.DOTALL)
+
+# Blocs remplacés lors de la mise à jour d'un XMP existant
+_DC_DESCRIPTION_RE = re.compile(r'<dc:description>.*?</dc:description>', re.DOTALL)
+_DC_SUBJECT_RE = re.compile(r'<dc:subject>.*?</dc:subject>', re.DOTALL)
+_RDF_DESCRIPTION_OPEN_RE = re.compile(r'<rdf:Description rdf:about=""([^>]*)>')
+
+# Enveloppes des blocs dc:subject / dc:description (création et mise à jour d'un XMP)
+_DC_SUBJECT_OPEN = "<dc:subject>\n            <rdf:Bag>\n               <rdf:li>"
+_DC_SUBJECT_ITEM_SEP = "</rdf:li>\n               <rdf:li>"
+_DC_SUBJECT_CLOSE = "</rdf:li>\n            </rdf:Bag>\n         </dc:subject>"
+_DC_DESCRIPTION_OPEN = '<dc:description>\n            <rdf:Alt>\n               <rdf:li xml:lang="x-default">'
+_DC_DESCRIPTION_CLOSE = "</rdf:li>\n            </rdf:Alt>\n         </dc:description>"
+
+# Déclaration de l'espace de noms LightKeyia (partagée par la création et la mise à jour)
+_LIGHTKEYIA_NS_DECL = 'xmlns:lightkeyia="http://lightkeyia.com/ns/1.0/"'
+
+# Segments statiques du nouveau fichier XMP, encodés une seule fois au chargement du module
+_XMP_HEAD = (b'<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 5.5.0">\n'
+             b'   <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+             b'      <rdf:Description rdf:about=""\n'
+             b'            xmlns:dc="http://purl.org/dc/elements/1.1/"\n'
+             b'            xmlns:xmp="http://ns.adobe.com/xap/1.0/"\n'
+             b'            xmlns:xmpRights="http://ns.adobe.com/xap/1.0/rights/"\n'
+             b'            ' + _LIGHTKEYIA_NS_DECL.encode('ascii') + b'>\n'
+             b'         ')
+_XMP_SEP = b'\n         '
+_XMP_DATE_OPEN = b'\n         <xmp:MetadataDate>'
+_XMP_DATE_CLOSE = (b'</xmp:MetadataDate>\n'
+                   b'         <xmpRights:Marked>True</xmpRights:Marked>\n'
+                   b'         <lightkeyia:keywords>')
+_XMP_TAIL = (b'</lightkeyia:keywords>\n'
+             b'      </rdf:Description>\n'
+             b'   </rdf:RDF>\n'
+             b'</x:xmpmeta>')
+
+def _write_segments(path, segments):
+    """Écrire une suite de segments d'octets dans un fichier avec un minimum d'appels système"""
+    if not hasattr(os, 'writev'):
+        # os.writev n'existe pas sous Windows : une seule écriture du contenu assemblé
+        with open(path, 'wb') as f:
+            f.write(b"".join(segments))
+        return
+    
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        written = os.writev(fd, segments)
+        total = sum(len(segment) for segment in segments)
+        if written < total:
+            # Écriture partielle : terminer avec le reste du contenu
+            remaining = memoryview(b"".join(segments))[written:]
+            while remaining:
+                remaining = remaining[os.write(fd, remaining):]
+    finally:
+        os.close(fd)
+
+class _SubmitRateLimiter:
+    """Seau à jetons limitant le rythme de soumission des images (rate=None : pas de limite)"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+    
+    def delay(self):
+        """Temps à attendre avant la prochaine soumission, 0 si un jeton est disponible"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def consume(self):
+        """Consommer un jeton pour une soumission"""
+        if self.rate:
+            self.tokens -= 1
+
 class ImageProcessor:
     """Image processor for analysis with Ollama and XMP keyword generation"""
     
@@ -61,8 +200,10 @@ class ImageProcessor:
         self.processed_images = 0
         self.skipped_images = 0
         self.failed_images = 0
-        self.logs = []
-        self.start_time = None
+        self.logs = deque(maxlen=200)  # Seuls les 200 derniers logs sont exposés à l'interface
+        self._log_seq = 0  # Nombre total de logs ajoutés (curseur pour les lectures incrémentales)
+        self._log_lock = threading.Lock()  # Protège ensemble logs et _log_seq (threads d'analyse, de préparation et d'écriture)
+        self.start_time = None        # Horloge monotone (time.monotonic) pour les durées
         self.pause_start_time = None  # Pour suivre le temps de pause
         self.total_pause_time = 0     # Temps total de pause
         self.processing_images = set()  # Set to track images being processed
@@ -70,7 +211,21 @@ class ImageProcessor:
         self.last_log_time = None      # To limit log frequency
         
         # Statistiques de traitement
-        self.processing_times = []  # Liste des temps de traitement pour calculer la moyenne
+        # Somme et nombre des temps de traitement, mis à jour à chaque image (moyenne en O(1))
+        self._pt_sum = 0.0
+        self._pt_count = 0
+        
+        # Pool d'E/S pour écrire les XMP/JPG en parallèle de l'inférence suivante
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="metadata-writer")
+        self._pending_writes = set()
+        self._pending_writes_lock = threading.Lock()
+        self._max_pending_writes = 16  # Borne la mémoire occupée par les écritures en attente
+        
+        # Pool de préparation (conversion RAW, redimensionnement) du lot suivant
+        # Des threads suffisent : LibRaw et le décodage/rééchantillonnage de Pillow relâchent le GIL
+        self._prep_pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="image-prep")
+        self._prefetched = {}  # image_path -> Future de _prepare_image
+        self._prefetch_lock = threading.Lock()
         
         # Initialize Ollama client
         self.ollama_client = OllamaClient(ollama_urls)
@@ -149,12 +304,10 @@ class ImageProcessor:
         timestamp = current_time.strftime("%H:%M:%S" if current_time.microsecond == 0 else "%H:%M:%S.%f")
         log_entry = f"{timestamp} - {message}"
         
-        # Limiter la taille de la liste des logs pour éviter les problèmes de mémoire
-        if len(self.logs) >= 1000:
-            # Garder seulement les 500 derniers logs
-            self.logs = self.logs[-500:]
-        
-        self.logs.append(log_entry)
+        # La deque est bornée : les plus anciens logs sont supprimés automatiquement
+        with self._log_lock:
+            self.logs.append(log_entry)
+            self._log_seq += 1
         logger.info(message)
         
         # Update last message and time
@@ -165,93 +318,125 @@ class ImageProcessor:
         from utils import clear_cache
         return clear_cache()
 
-    def extract_image_metadata(self, image_path):
-        """Extract basic metadata from image file"""
+    def cache_stats(self):
+        from utils import cache_stats
+        return cache_stats()
+
+    def _read_pil_metadata(self, img, metadata):
+        """Remplir metadata (format, mode, taille, EXIF) à partir d'une image PIL déjà ouverte"""
+        # Extract basic image info
+        metadata['format'] = img.format
+        metadata['mode'] = img.mode
+        metadata['size'] = img.size
+        
+        # Extract EXIF data if available (_getexif n'est appelé qu'une fois)
+        exif_data = {}
+        exif = img._getexif() if hasattr(img, '_getexif') else None
+        if exif:
+            # EXIF tags mapping
+            for tag_id, value in exif.items():
+                exif_data[TAGS.get(tag_id, tag_id)] = value
+        
+        metadata['exif'] = exif_data
+        return metadata
+
+    def _resize_opened_image(self, img, image_path):
+        """Redimensionner une image PIL déjà ouverte et l'encoder en JPEG RGB
+        
+        Retourne le chemin d'origine pour un JPEG déjà assez petit, sinon les octets JPEG.
+        """
+        # Image.open n'a lu que l'en-tête : un JPEG déjà assez petit est envoyé tel quel, sans décodage ni réencodage.
+        # Les autres formats (PNG RGBA, GIF, TIFF, BMP, HEIC...) sont toujours réencodés en JPEG RGB
+        if img.format == 'JPEG' and max(img.size) <= self.max_size:
+            return image_path  # No resize needed
+        
+        # Resize needed (en place, proportions calculées par thumbnail)
+        resized_img = _downscale(img, self.max_size)
+        new_width, new_height = resized_img.size
+        
+        # Convert to RGB if needed
+        if resized_img.mode != 'RGB':
+            resized_img = resized_img.convert('RGB')
+        
+        # Encode to an in-memory JPEG (pas de fichier temporaire)
+        buffer = io.BytesIO()
+        resized_img.save(buffer, "JPEG", quality=85)
+        
+        logger.info(f"Image resized in memory: {image_path} ({new_width}x{new_height})")
+        return buffer.getvalue()
+
+    def _prepare_image(self, image_path):
+        """Préparer une image pour l'analyse en une seule ouverture PIL : métadonnées puis conversion RAW ou redimensionnement
+        
+        Retourne (metadata, image) où image est le chemin d'origine ou les octets JPEG à envoyer,
+        None si la conversion échoue.
+        """
+        ext = os.path.splitext(image_path)[1].lower()
+        if ext in RAW_EXTENSIONS:
+            # For RAW files, minimal metadata then in-memory JPEG conversion
+            metadata = {'format': ext[1:].upper(), 'is_raw': True, 'exif': {}}
+            return metadata, self._cached_preview(image_path, lambda: convert_raw_to_jpeg(image_path, self.max_size))
+        
+        metadata = {}
         try:
-            metadata = {}
-            
-            # Check if it's a RAW file
-            ext = os.path.splitext(image_path)[1].lower()
-            if ext in RAW_EXTENSIONS:
-                # For RAW files, return minimal metadata
-                metadata['format'] = ext[1:].upper()  # Format based on extension
-                metadata['is_raw'] = True
-                metadata['exif'] = {}  # Empty EXIF data for RAW files
-                logger.info(f"RAW file detected: {image_path}, minimal metadata created")
-            else:
-                # For standard formats, try to use PIL
-                try:
-                    with Image.open(image_path) as img:
-                        # Extract basic image info
-                        metadata['format'] = img.format
-                        metadata['mode'] = img.mode
-                        metadata['size'] = img.size
-                        
-                        # Extract EXIF data if available
-                        exif_data = {}
-                        if hasattr(img, '_getexif') and img._getexif():
-                            exif = img._getexif()
-                            if exif:
-                                # EXIF tags mapping
-                                from PIL.ExifTags import TAGS
-                                for tag_id, value in exif.items():
-                                    tag = TAGS.get(tag_id, tag_id)
-                                    exif_data[tag] = value
-                        
-                        metadata['exif'] = exif_data
-                except Exception as e:
-                    logger.warning(f"Could not open image with PIL: {str(e)}")
-                    # Create minimal metadata
-                    metadata['format'] = ext[1:].upper()
-                    metadata['exif'] = {}
-            
-            # Check for existing XMP file
-            xmp_path = os.path.splitext(image_path)[0] + '.xmp'
-            if os.path.exists(xmp_path):
+            with Image.open(image_path) as img:
+                self._read_pil_metadata(img, metadata)
                 try:
-                    with open(xmp_path, 'r', encoding='utf-8') as f:
-                        metadata['xmp'] = f.read()
-                    logger.info(f"Existing XMP file found: {xmp_path}")
+                    # Un JPEG déjà assez petit est envoyé tel quel, sans décodage : rien à mettre en cache
+                    if ext in _JPEG_EXTENSIONS and max(img.size) <= self.max_size:
+                        return metadata, image_path
+                    return metadata, self._cached_preview(image_path, lambda: self._resize_opened_image(img, image_path))
                 except Exception as e:
-                    logger.warning(f"Could not read existing XMP file: {str(e)}")
-            
-            return metadata
+                    logger.error(f"Error resizing image: {str(e)}")
+                    # Seul un JPEG peut être envoyé tel quel en cas d'échec
+                    return metadata, image_path if ext in _JPEG_EXTENSIONS else None
         except Exception as e:
-            logger.error(f"Error extracting metadata from image {image_path}: {str(e)}")
-            return {'format': os.path.splitext(image_path)[1][1:].upper(), 'exif': {}}
+            logger.warning(f"Could not open image with PIL: {str(e)}")
+            return {'format': ext[1:].upper(), 'exif': {}}, image_path if ext in _JPEG_EXTENSIONS else None
 
-    def _resize_image_if_needed(self, image_path):
-        """Resize image if needed for processing"""
-        try:
-            with Image.open(image_path) as img:
-                width, height = img.size
-                if max(width, height) <= self.max_size:
-                    return image_path  # No resize needed
-                
-                # Resize needed
-                if width > height:
-                    new_width = self.max_size
-                    new_height = int(height * (self.max_size / width))
-                else:
-                    new_height = self.max_size
-                    new_width = int(width * (self.max_size / height))
-                
-                # Create resized image
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-                
-                # Convert to RGB if needed
-                if resized_img.mode != 'RGB':
-                    resized_img = resized_img.convert('RGB')
-                
-                # Save to temporary file
-                temp_image_path = os.path.join(tempfile.gettempdir(), f"temp_resize_{os.path.basename(image_path)}")
-                resized_img.save(temp_image_path, "JPEG", quality=85)
-                
-                logger.info(f"Image resized: {image_path} -> {temp_image_path}")
-                return temp_image_path
-        except Exception as e:
-            logger.error(f"Error resizing image: {str(e)}")
-            return image_path  # Return original path on error
+    def _cached_preview(self, image_path, build):
+        """Retourner l'aperçu réduit depuis le cache disque, ou le construire avec build() et le mettre en cache
+        
+        La clé inclut la date de modification et la taille du fichier : une image modifiée est recalculée.
+        """
+        key = get_preview_cache_key(image_path, self.max_size)
+        if key is not None:
+            data = load_cached_preview(key)
+            if data is not None:
+                logger.info(f"Preview cache hit for {image_path}")
+                return data
+        
+        data = build()
+        if key is not None and isinstance(data, bytes):
+            save_cached_preview(key, data)
+        return data
+
+    def _prefetch_images(self, image_paths):
+        """Préparer à l'avance les images du prochain lot pendant que le lot courant attend Ollama"""
+        with self._prefetch_lock:
+            for image_path in image_paths:
+                if image_path not in self._prefetched:
+                    self._prefetched[image_path] = self._prep_pool.submit(self._prepare_image, image_path)
+
+    def _take_prepared_image(self, image_path):
+        """Récupérer le résultat de la préparation anticipée, ou préparer l'image maintenant"""
+        with self._prefetch_lock:
+            future = self._prefetched.pop(image_path, None)
+        if future is not None:
+            return future.result()
+        return self._prepare_image(image_path)
+
+    def _drop_prefetched(self, image_path=None):
+        """Abandonner une préparation anticipée (ou toutes)"""
+        with self._prefetch_lock:
+            if image_path is None:
+                futures = list(self._prefetched.values())
+                self._prefetched.clear()
+            else:
+                future = self._prefetched.pop(image_path, None)
+                futures = [future] if future is not None else []
+        for future in futures:
+            future.cancel()
 
     def process_directory(self, directory, recursive=True):
         if self.is_processing:
@@ -266,12 +451,15 @@ class ImageProcessor:
         self.processed_images = 0
         self.skipped_images = 0
         self.failed_images = 0
-        self.logs = []  # Réinitialiser les logs au début du traitement
-        self.processing_times = []  # Réinitialiser les temps de traitement
-        self.start_time = datetime.now()
+        with self._log_lock:
+            self.logs.clear()  # Réinitialiser les logs au début du traitement
+        self._pt_sum = 0.0  # Réinitialiser les temps de traitement
+        self._pt_count = 0
+        self.start_time = time.monotonic()
         self.pause_start_time = None
         self.total_pause_time = 0
         self.processing_images.clear()  # Reset the set of images being processed
+        _dir_index.cache_clear()  # Le contenu des répertoires a pu changer depuis le dernier traitement
         
         try:
             # Préchargement du modèle avant de commencer le traitement
@@ -282,19 +470,10 @@ class ImageProcessor:
                 self.add_log(f"Modèle {self.model} préchargé avec succès sur les instances disponibles")
             
             # Collect all images
-            image_files = []
             self.add_log(f"Searching for images in {directory}")
             
-            for root, _, files in os.walk(directory):
-                if not recursive and root != directory:
-                    continue
-                
-                for file in files:
-                    if file.lower().endswith(RAW_EXTENSIONS) or any(file.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif', '.heic', '.heif']):
-                        image_files.append(os.path.join(root, file))
-        
-            # Remove potential duplicates
-            image_files = list(set(image_files))
+            # Parcours par os.scandir : chaque chemin est unique, pas de dédoublonnage nécessaire
+            image_files = list(_iter_images(directory, recursive))
             
             self.total_images = len(image_files)
             self.add_log(f"Found {self.total_images} images to process")
@@ -304,88 +483,115 @@ class ImageProcessor:
                 self.is_processing = False
                 return True
             
-            # First check which images are already in the cache
-            cached_images = []
-            for image_path in image_files:
-                if _is_in_cache(image_path, self.force_processing):
-                    cached_images.append(image_path)
+            # First check which images are already in the cache (une seule vérification par image)
+            uncached_images = [img for img in image_files if not _is_in_cache(img, self.force_processing)]
+            cached_count = len(image_files) - len(uncached_images)
             
-            if cached_images:
-                self.add_log(f"Found {len(cached_images)} images already in cache")
-                self.skipped_images += len(cached_images)
+            if cached_count:
+                self.add_log(f"Found {cached_count} images already in cache")
+                self.skipped_images += cached_count
                 # Remove cached images from the list to process
-                image_files = [img for img in image_files if img not in cached_images]
+                image_files = uncached_images
+            
+            # Pré-filtrer en parallèle les images dont le XMP contient déjà des mots-clés (E/S pures, sans ouvrir les images)
+            if self.validate_xmp and image_files:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max(8, self.threads * 4), thread_name_prefix="xmp-prefilter") as prefilter:
+                    tagged = list(prefilter.map(self._has_tagged_xmp, image_files))
+                tagged_images = [img for img, has_keywords in zip(image_files, tagged) if has_keywords]
+                if tagged_images:
+                    self.add_log(f"Found {len(tagged_images)} images with existing XMP keywords, skipped")
+                    self.skipped_images += len(tagged_images)
+                    # Add to cache to prevent future processing
+                    for image_path in tagged_images:
+                        _add_to_cache(image_path)
+                    image_files = [img for img, has_keywords in zip(image_files, tagged) if not has_keywords]
             
             # Update progress immediately
             if self.total_images > 0:  # Éviter la division par zéro
                 self.progress = (self.processed_images + self.skipped_images + self.failed_images) / self.total_images * 100
             
-            # Traiter les images par lots avec une gestion adaptative de la charge
-            batch_index = 0
-            consecutive_failures = 0
+            # Traitement continu : une fenêtre bornée d'images en vol, réalimentée à chaque résultat,
+            # pour que la préparation des images suivantes recouvre l'inférence Ollama
+            # Fenêtre AIMD : divisée par deux à chaque échec, +1 après une fenêtre complète de succès
+            window = self.batch_size
+            successes_since_increase = 0
             adaptive_pause = self.pause_between_batches
-            stats_check_counter = 0
+            # Au plus batch_size soumissions par période de pause_between_batches secondes
+            submit_rate = self.batch_size / self.pause_between_batches if self.pause_between_batches > 0 else None
+            limiter = _SubmitRateLimiter(submit_rate, self.batch_size)
+            hold_until = 0.0  # Soumissions suspendues jusqu'à cet instant (échecs ou charge CPU)
+            stats_interval = self.batch_size * 5
+            completed_since_stats = 0
+            next_index = 0
+            in_flight = {}  # Future -> image_path
             
-            while batch_index < len(image_files):
-                # Vérifier si le traitement doit être arrêté
-                if self.should_stop:
-                    self.add_log("Processing stopped by user")
-                    break
-                
-                # Vérifier si le traitement est en pause
-                if self.paused:
-                    # Si c'est le début de la pause, enregistrer le temps de début
-                    if self.pause_start_time is None:
-                        self.pause_start_time = datetime.now()
-                        self.add_log("Processing paused")
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="image-analysis")
+            try:
+                while next_index < len(image_files) or in_flight:
+                    # Vérifier si le traitement doit être arrêté
+                    if self.should_stop:
+                        self.add_log("Processing stopped by user")
+                        break
                     
-                    # Attendre que la pause soit terminée
-                    self.pause_event.wait(1)  # Vérifier toutes les secondes
-                    continue
-                elif self.pause_start_time is not None:
-                    # Si on sort de la pause, calculer le temps de pause
-                    pause_duration = (datetime.now() - self.pause_start_time).total_seconds()
-                    self.total_pause_time += pause_duration
-                    self.add_log(f"Processing resumed after {pause_duration:.1f} seconds")
-                    self.pause_start_time = None
-                
-                # Déterminer la taille du lot en fonction des échecs précédents
-                current_batch_size = max(1, self.batch_size - consecutive_failures)
-                batch = image_files[batch_index:batch_index+current_batch_size]
-                batch_index += len(batch)
-                
-                self.add_log(f"Processing batch of {len(batch)} images (adaptive size: {current_batch_size})")
-                
-                # Vérifier la charge du système avant de soumettre le lot
-                system_load = psutil.cpu_percent(interval=0.5)
-                if system_load > 90:  # Charge CPU élevée
-                    self.add_log(f"System load is high ({system_load}%), pausing for recovery")
-                    time.sleep(10)  # Pause plus longue pour récupération
-                    continue
-                
-                # Only submit images that aren't already being processed
-                futures = {}
-                with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
-                    for image_path in batch:
-                        # Vérifier si le traitement est en pause
+                    # Vérifier si le traitement est en pause (les images en vol se terminent normalement)
+                    if self.paused:
+                        # Si c'est le début de la pause, enregistrer le temps de début
+                        if self.pause_start_time is None:
+                            self.pause_start_time = time.monotonic()
+                            self.add_log("Processing paused")
+                    elif self.pause_start_time is not None:
+                        # Si on sort de la pause, calculer le temps de pause
+                        pause_duration = time.monotonic() - self.pause_start_time
+                        self.total_pause_time += pause_duration
+                        self.add_log(f"Processing resumed after {pause_duration:.1f} seconds")
+                        self.pause_start_time = None
+                    
+                    # Alimenter la fenêtre (taille réduite après des échecs)
+                    idle_wait = 0.5
+                    now = time.monotonic()
+                    if not self.paused and now >= hold_until and next_index < len(image_files):
+                        # Vérifier la charge du système (non bloquant : mesure depuis l'appel précédent)
+                        system_load = psutil.cpu_percent(interval=None)
+                        if system_load > 90:  # Charge CPU élevée
+                            self.add_log(f"System load is high ({system_load}%), pausing for recovery")
+                            hold_until = now + 10  # Pause plus longue pour récupération
+                        else:
+                            while next_index < len(image_files) and len(in_flight) < window:
+                                delay = limiter.delay()
+                                if delay > 0:
+                                    idle_wait = min(idle_wait, delay)
+                                    break
+                                limiter.consume()
+                                image_path = image_files[next_index]
+                                next_index += 1
+                                
+                                # Only submit images that aren't already being processed
+                                if image_path not in self.processing_images:
+                                    self.processing_images.add(image_path)
+                                    in_flight[executor.submit(self.process_image, image_path, True)] = image_path
+                            
+                            # Préparer en arrière-plan les images qui suivent la fenêtre
+                            self._prefetch_images(image_files[next_index:next_index + self.batch_size])
+                    
+                    if not in_flight:
+                        # Rien en vol : attendre la reprise, la fin de la suspension ou le prochain jeton
                         if self.paused:
-                            # Attendre que la pause soit terminée
-                            self.pause_event.wait(1)  # Vérifier toutes les secondes
-                            continue
-                        
-                        if image_path not in self.processing_images:
-                            self.processing_images.add(image_path)
-                            futures[executor.submit(self.process_image, image_path)] = image_path
-                
-                    # Compter les succès et échecs pour ce lot
-                    batch_failures = 0
+                            self.pause_event.wait(idle_wait)
+                        else:
+                            remaining_hold = hold_until - time.monotonic()
+                            time.sleep(min(idle_wait, remaining_hold) if remaining_hold > 0 else idle_wait)
+                        continue
                     
-                    for future in concurrent.futures.as_completed(futures):
-                        image_path = futures[future]
+                    done, _ = concurrent.futures.wait(in_flight, timeout=idle_wait, return_when=concurrent.futures.FIRST_COMPLETED)
+                    
+                    for future in done:
+                        image_path = in_flight.pop(future)
+                        failed = False
                         try:
                             result, processing_time = future.result()
                             if processing_time:
-                                self.processing_times.append(processing_time)
+                                self._pt_sum += processing_time
+                                self._pt_count += 1
                             
                             if result == "SKIPPED":
                                 self.skipped_images += 1
@@ -393,54 +599,58 @@ class ImageProcessor:
                                 self.processed_images += 1
                             else:  # None = failed
                                 self.failed_images += 1
-                                batch_failures += 1
-                            
-                            # Remove the image from the set of images being processed
-                            self.processing_images.discard(image_path)
-                            
-                            # Update progress
-                            if self.total_images > 0:  # Éviter la division par zéro
-                                self.progress = (self.processed_images + self.skipped_images + self.failed_images) / self.total_images * 100
+                                failed = True
                         except Exception as e:
                             self.add_log(f"Error processing {image_path}: {str(e)}")
                             self.failed_images += 1
-                            self.processing_images.discard(image_path)
-                            batch_failures += 1
-                
-                # Ajuster la pause et la taille du lot en fonction des résultats
-                if batch_failures > 0:
-                    consecutive_failures += 1
-                    # Augmenter la pause si des échecs se produisent
-                    adaptive_pause = min(60, adaptive_pause * 1.5)  # Maximum 60 secondes
-                    self.add_log(f"Batch had {batch_failures} failures, increasing pause to {adaptive_pause:.1f}s")
-                else:
-                    consecutive_failures = max(0, consecutive_failures - 1)
-                    # Réduire progressivement la pause si tout va bien
-                    adaptive_pause = max(self.pause_between_batches, adaptive_pause * 0.8)
-                
-                # Pause adaptative entre les lots
-                if batch_index < len(image_files) and adaptive_pause > 0 and not self.should_stop and not self.paused:
-                    self.add_log(f"Pausing for {adaptive_pause:.1f} seconds between batches")
-                    time.sleep(adaptive_pause)
-                
-                # Vérifier périodiquement l'état des instances Ollama
-                stats_check_counter += 1
-                if stats_check_counter % 5 == 0:  # Tous les 5 lots
-                    self.add_log("--- Instance Statistics ---")
-                    for i, instance in enumerate(self.ollama_client.instances):
-                        if instance.is_available:
-                            self.add_log(f"Instance {i+1} ({instance.url}): Active: {instance.active_requests}, Total: {instance.total_requests}, Avg Time: {instance.get_average_response_time():.2f}s")
-                    self.add_log("-------------------------")
+                            failed = True
+                        
+                        # Remove the image from the set of images being processed
+                        self.processing_images.discard(image_path)
+                        
+                        # Update progress
+                        if self.total_images > 0:  # Éviter la division par zéro
+                            self.progress = (self.processed_images + self.skipped_images + self.failed_images) / self.total_images * 100
+                        
+                        # Ajuster la pause et la taille de la fenêtre en fonction des résultats
+                        if failed:
+                            window = max(1, window // 2)
+                            successes_since_increase = 0
+                            # Augmenter la pause si des échecs se produisent
+                            adaptive_pause = min(60, adaptive_pause * 1.5)  # Maximum 60 secondes
+                            if adaptive_pause > 0:
+                                hold_until = time.monotonic() + adaptive_pause
+                                self.add_log(f"Image failed, pausing new submissions for {adaptive_pause:.1f}s")
+                        else:
+                            successes_since_increase += 1
+                            if successes_since_increase >= window:
+                                window = min(self.batch_size, window + 1)
+                                successes_since_increase = 0
+                            # Réduire progressivement la pause si tout va bien
+                            adaptive_pause = max(self.pause_between_batches, adaptive_pause * 0.8)
+                        
+                        # Vérifier périodiquement l'état des instances Ollama
+                        completed_since_stats += 1
+                        if completed_since_stats >= stats_interval:
+                            completed_since_stats = 0
+                            self.add_log("--- Instance Statistics ---")
+                            for i, instance in enumerate(self.ollama_client.instances):
+                                if instance.is_available:
+                                    self.add_log(f"Instance {i+1} ({instance.url}): Active: {instance.active_requests}, Total: {instance.total_requests}, Avg Time: {instance.get_average_response_time():.2f}s")
+                            self.add_log("-------------------------")
+            finally:
+                # Les images en vol se terminent, celles pas encore démarrées sont annulées
+                executor.shutdown(wait=True, cancel_futures=True)
             
             self.add_log(f"=== PROCESSING COMPLETE === Processed: {self.processed_images}, Skipped: {self.skipped_images}, Failed: {self.failed_images}")
             
             # Calculer et afficher les statistiques de traitement
-            if self.processing_times:
-                avg_time = sum(self.processing_times) / len(self.processing_times)
+            if self._pt_count:
+                avg_time = self._pt_sum / self._pt_count
                 self.add_log(f"Average processing time per image: {avg_time:.2f} seconds")
                 
                 if self.processed_images > 0:
-                    total_time = (datetime.now() - self.start_time).total_seconds() - self.total_pause_time
+                    total_time = time.monotonic() - self.start_time - self.total_pause_time
                     images_per_second = self.processed_images / total_time if total_time > 0 else 0
                     self.add_log(f"Processing speed: {images_per_second:.2f} images per second")
                     self.add_log(f"Total pause time: {self.total_pause_time:.1f} seconds")
@@ -451,24 +661,45 @@ class ImageProcessor:
                 if instance.is_available:
                     self.add_log(f"Instance {i+1} ({instance.url}): {instance.total_requests} requests, {instance.get_average_response_time():.2f}s avg time")
             
+            # Afficher les statistiques du cache des images traitées
+            stats = self.cache_stats()
+            self.add_log(f"Cache: {stats['processed_images']} processed images, key lookups {stats['key_hits']} hits / {stats['key_misses']} misses")
+            
             return True
         except Exception as e:
             self.add_log(f"Error processing directory: {str(e)}")
             return False
         finally:
+            # S'assurer que toutes les métadonnées sont écrites avant de déclarer la fin du traitement
+            self.wait_for_pending_writes()
+            # Nettoyer les préparations anticipées non utilisées (arrêt demandé)
+            self._drop_prefetched()
             self.is_processing = False
             self.paused = False
             self.pause_event.set()
             self.processing_images.clear()
 
-    def process_image(self, image_path):
-        """Process a single image and generate keywords"""
-        temp_files_to_clean = []  # List to track all temporary files created
-        start_time = time.time()  # Mesurer le temps de traitement
+    def _has_tagged_xmp(self, image_path):
+        """Vérifier si le XMP associé à l'image existe et contient déjà des mots-clés"""
+        image_root = os.path.splitext(image_path)[0]
+        # Index du répertoire (un seul scandir par dossier) : aucune ouverture quand le XMP n'existe pas,
+        # ce qui évite un aller-retour par image sur un partage réseau
+        dir_path, base_name = os.path.split(image_root)
+        if base_name.lower() + '.xmp' not in _dir_index(dir_path or '.'):
+            return False
+        return has_keywords_in_xmp(image_root + '.xmp')
+
+    def process_image(self, image_path, prefiltered=False):
+        """Process a single image and generate keywords
+        
+        prefiltered: le cache et le XMP existant ont déjà été vérifiés par l'appelant (pré-filtrage de process_directory)
+        """
+        start_time = time.monotonic()  # Mesurer le temps de traitement
         processing_time = None
         
         try:
             if self.should_stop:
+                self._drop_prefetched(image_path)
                 return False, None
             
             # Vérifier si le traitement est en pause
@@ -478,261 +709,302 @@ class ImageProcessor:
             self.add_log(f"Using model: {self.model} with temperature: {self.temperature}")
         
             # Check if image is already in cache
-            if _is_in_cache(image_path, self.force_processing):
+            if not prefiltered and _is_in_cache(image_path, self.force_processing):
                 self.add_log(f"Image already processed (in cache): {image_path}")
+                self._drop_prefetched(image_path)
                 return "SKIPPED", None
         
+            # Décomposer le chemin une seule fois (réutilisé pour XMP, RAW et JPG associé)
+            image_root, ext = os.path.splitext(image_path)
+            ext = ext.lower()
+            
             # Check if an XMP file already exists and has keywords
-            xmp_path = os.path.splitext(image_path)[0] + '.xmp'
+            xmp_path = image_root + '.xmp'
         
             # If XMP validation is enabled and XMP file already exists with keywords
-            if self.validate_xmp and os.path.exists(xmp_path):
+            # (has_keywords_in_xmp gère lui-même l'absence du fichier)
+            if self.validate_xmp and not prefiltered:
                 if has_keywords_in_xmp(xmp_path):
                     self.add_log(f"XMP file with keywords already exists, skipped")
                     # Add to cache to prevent future processing
                     _add_to_cache(image_path)
+                    self._drop_prefetched(image_path)
                     return "SKIPPED", None
             
-            # Extract metadata
-            metadata = self.extract_image_metadata(image_path)
+            # Extract metadata and convert RAW / resize in a single open
+            # (préparé à l'avance par le pool de préparation si possible)
+            metadata, image_to_process = self._take_prepared_image(image_path)
             self.add_log(f"Metadata extracted: {len(metadata)} elements")
+            if not image_to_process:
+                self.add_log(f"Could not convert image {image_path}")
+                return None, None
+            
+            # Add image to cache BEFORE processing to prevent race conditions
+            _add_to_cache(image_path)
             
-            # Check if it's a RAW file and convert if necessary
-            ext = os.path.splitext(image_path)[1].lower()
-            temp_dir = None
-            image_to_process = None
+            # Analyze image with Ollama using the new improved function
+            response = self.ollama_client.generate_with_image(
+                self.model, 
+                image_to_process,
+                self.system_prompt,
+                self.user_prompt,
+                self.temperature,
+                max_retries=self.max_retries,
+                request_timeout=self.request_timeout,
+                use_cache=not self.force_processing,
+                stop_after_json=True,
+                # Décodage contraint par Ollama : la réponse est un objet JSON, la réparation reste un filet de sécurité
+                response_format="json"
+            )
+        
+            if not response:
+                self.add_log(f"Failed to analyze image: {image_path}")
+                return None, None
             
+            # Log the raw response from the model
+            self.add_log(f"Raw model response for {os.path.basename(image_path)}: {response[:200]}...")
+        
+            # Try to parse response as JSON
             try:
-                if ext in RAW_EXTENSIONS:
-                    # Convert RAW to JPEG temporary
-                    temp_image_path, temp_dir = convert_raw_to_jpeg(image_path, self.max_size)
-                    if not temp_image_path:
-                        self.add_log(f"Could not convert RAW file {image_path}")
-                        return None, None
+                # Clean the response to ensure it's valid JSON
+                if response:
+                    # Find the first '{' and the last '}'
+                    start_idx = response.find('{')
+                    end_idx = response.rfind('}')
                     
-                    image_to_process = temp_image_path
-                    if temp_dir:
-                        temp_files_to_clean.append(("dir", temp_dir))
-                    if temp_image_path:
-                        temp_files_to_clean.append(("file", temp_image_path))
-                else:
-                    # Resize image if needed
-                    image_to_process = self._resize_image_if_needed(image_path)
-                    if image_to_process != image_path:
-                        temp_files_to_clean.append(("file", image_to_process))
-                
-                # Add image to cache BEFORE processing to prevent race conditions
-                _add_to_cache(image_path)
-                
-                # Analyze image with Ollama using the new improved function
-                response = self.ollama_client.generate_with_image(
-                    self.model, 
-                    image_to_process,
-                    self.system_prompt,
-                    self.user_prompt,
-                    self.temperature,
-                    max_retries=self.max_retries,
-                    request_timeout=self.request_timeout
-                )
-            
-                if not response:
-                    self.add_log(f"Failed to analyze image: {image_path}")
-                    return None, None
-                
-                # Log the raw response from the model
-                self.add_log(f"Raw model response for {os.path.basename(image_path)}: {response[:200]}...")
-            
-                # Try to parse response as JSON
-                try:
-                    # Clean the response to ensure it's valid JSON
-                    if response:
-                        # Find the first '{' and the last '}'
-                        start_idx = response.find('{')
-                        end_idx = response.rfind('}')
+                    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+                        json_str = response[start_idx:end_idx+1]
+                        # Parse JSON to validate it
+                        keywords = json_loads(json_str)
                         
-                        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                            json_str = response[start_idx:end_idx+1]
-                            # Parse JSON to validate it
-                            keywords = json.loads(json_str)
+                        # Add metadata information if available
+                        if metadata.get('exif'):
+                            # Extract relevant EXIF data
+                            exif = metadata['exif']
+                            technical_info = []
                             
-                            # Add metadata information if available
-                            if metadata.get('exif'):
-                                # Extract relevant EXIF data
-                                exif = metadata['exif']
-                                technical_info = []
-                                
-                                # Camera model
-                                if 'Model' in exif:
-                                    technical_info.append(f"camera:{exif['Model']}")
-                                
-                                # Focal length
-                                if 'FocalLength' in exif:
-                                    focal_length = exif['FocalLength']
-                                    if isinstance(focal_length, tuple) and len(focal_length) == 2:
-                                        technical_info.append(f"focal_length:{focal_length[0]/focal_length[1]}mm")
-                                    else:
-                                        technical_info.append(f"focal_length:{focal_length}mm")
-                                
-                                # Aperture
-                                if 'FNumber' in exif:
-                                    f_number = exif['FNumber']
-                                    if isinstance(f_number, tuple) and len(f_number) == 2:
-                                        technical_info.append(f"aperture:f/{f_number[0]/f_number[1]}")
-                                    else:
-                                        technical_info.append(f"aperture:f/{f_number}")
-                                
-                                # ISO
-                                if 'ISOSpeedRatings' in exif:
-                                    technical_info.append(f"iso:{exif['ISOSpeedRatings']}")
-                                
-                                # Exposure time
-                                if 'ExposureTime' in exif:
-                                    exp_time = exif['ExposureTime']
-                                    if isinstance(exp_time, tuple) and len(exp_time) == 2:
-                                        technical_info.append(f"exposure:{exp_time[0]}/{exp_time[1]}s")
-                                    else:
-                                        technical_info.append(f"exposure:{exp_time}s")
-                                
-                                # Add technical info to JSON data if not empty
-                                if technical_info and 'technical' in keywords:
-                                    keywords['technical'].extend(technical_info)
+                            # Camera model
+                            model = exif.get('Model')
+                            if model is not None:
+                                technical_info.append(f"camera:{model}")
                             
-                            self.add_log(f"Successfully parsed JSON response with metadata")
-                        else:
-                            self.add_log(f"Invalid JSON structure in response")
-                            keywords = clean_and_repair_json(response)
-                    else:
-                        self.add_log(f"Empty response from model")
-                        keywords = {"subjects": [], "objects": [], "scene": ["Description not available"]}
-                except json.JSONDecodeError:
-                    self.add_log(f"Invalid response (not JSON): {response[:100]}...")
-                    keywords = clean_and_repair_json(response)
-            
-                # Write metadata to XMP file
-                self.save_xmp(image_path, xmp_path, keywords)
-            
-                # Write metadata to JPG file if requested
-                if self.write_jpg_metadata:
-                    # Check if the file is a JPG or if there's an associated JPG for RAW files
-                    jpg_to_update = None
-                    
-                    if os.path.splitext(image_path)[1].lower() in ['.jpg', '.jpeg']:
-                        jpg_to_update = image_path
-                    elif os.path.splitext(image_path)[1].lower() in RAW_EXTENSIONS:
-                        # Look for associated JPG
-                        potential_jpg = os.path.splitext(image_path)[0] + '.jpg'
-                        if os.path.exists(potential_jpg):
-                            jpg_to_update = potential_jpg
-                            self.add_log(f"Associated JPG found for RAW: {jpg_to_update}")
-                        else:
-                            potential_jpg = os.path.splitext(image_path)[0] + '.jpeg'
-                            if os.path.exists(potential_jpg):
-                                jpg_to_update = potential_jpg
-                                self.add_log(f"Associated JPEG found for RAW: {jpg_to_update}")
-                    
-                    if jpg_to_update:
-                        if EXIFTOOL_AVAILABLE:
-                            keywords_list, scene_desc = extract_keywords_from_json(keywords)
-                            success = save_jpg_metadata_with_exiftool(jpg_to_update, keywords_list, scene_desc)
-                        else:
-                            success = save_jpg_metadata_with_pillow(jpg_to_update, None, None)
+                            # Focal length
+                            focal_length = exif.get('FocalLength')
+                            if focal_length is not None:
+                                technical_info.append(f"focal_length:{_exif_ratio(focal_length)}mm")
+                            
+                            # Aperture
+                            f_number = exif.get('FNumber')
+                            if f_number is not None:
+                                technical_info.append(f"aperture:f/{_exif_ratio(f_number)}")
+                            
+                            # ISO
+                            iso = exif.get('ISOSpeedRatings')
+                            if iso is not None:
+                                technical_info.append(f"iso:{iso}")
+                            
+                            # Exposure time (gardée sous forme de fraction)
+                            exp_time = exif.get('ExposureTime')
+                            if exp_time is not None:
+                                if isinstance(exp_time, tuple) and len(exp_time) == 2:
+                                    technical_info.append(f"exposure:{exp_time[0]}/{exp_time[1]}s")
+                                else:
+                                    technical_info.append(f"exposure:{exp_time}s")
+                            
+                            # Add technical info to JSON data if not empty
+                            if technical_info and 'technical' in keywords:
+                                keywords['technical'].extend(technical_info)
                         
-                        if success:
-                            self.add_log(f"Metadata written to JPG file: {jpg_to_update}")
-                        else:
-                            self.add_log(f"Failed to write metadata to JPG file: {jpg_to_update}")
+                        self.add_log(f"Successfully parsed JSON response with metadata")
+                    else:
+                        self.add_log(f"Invalid JSON structure in response")
+                        keywords = clean_and_repair_json(response)
+                else:
+                    self.add_log(f"Empty response from model")
+                    keywords = {"subjects": [], "objects": [], "scene": ["Description not available"]}
+            except json.JSONDecodeError:
+                self.add_log(f"Invalid response (not JSON): {response[:100]}...")
+                keywords = clean_and_repair_json(response)
+        
+            # Extraire les mots-clés une seule fois pour le XMP et le JPG
+            keywords_list, scene_desc = extract_keywords_from_json(keywords)
+            
+            # Determine the JPG to update if requested
+            jpg_to_update = None
+            if self.write_jpg_metadata:
+                # Check if the file is a JPG or if there's an associated JPG for RAW files
+                if ext in _JPEG_EXTENSIONS:
+                    jpg_to_update = image_path
+                elif ext in RAW_EXTENSIONS:
+                    # Look for associated JPG (index du répertoire mis en cache)
+                    dir_path, base_name = os.path.split(image_root)
+                    dir_index = _dir_index(dir_path or '.')
+                    base_name = base_name.lower()
+                    for jpg_ext in ('.jpg', '.jpeg'):
+                        jpg_name = dir_index.get(base_name + jpg_ext)
+                        if jpg_name:
+                            jpg_to_update = os.path.join(dir_path, jpg_name)
+                            self.add_log(f"Associated {jpg_ext[1:].upper()} found for RAW: {jpg_to_update}")
+                            break
+            
+            # Écrire le XMP et le JPG sur le pool d'E/S : l'analyse de l'image suivante
+            # démarre sans attendre les écritures disque et ExifTool
+            self._submit_metadata_write(image_path, xmp_path, keywords, (keywords_list, scene_desc), jpg_to_update)
+        
+            # Calculer le temps de traitement
+            processing_time = time.monotonic() - start_time
+            self.add_log(f"Image processed successfully in {processing_time:.2f} seconds: {image_path}")
+            
+            self.update_progress_state()
+            return True, processing_time
             
-                # Calculer le temps de traitement
-                processing_time = time.time() - start_time
-                self.add_log(f"Image processed successfully in {processing_time:.2f} seconds: {image_path}")
-                
-                self.update_progress_state()
-                return True, processing_time
-                
-            finally:
-                # Clean up all temporary files
-                _cleanup_temp_files(temp_files_to_clean)
-                
         except Exception as e:
             self.add_log(f"Error processing {image_path}: {str(e)}")
             return None, None
 
-    def save_xmp(self, image_path, xmp_path, description):
-        """Save description to XMP file"""
+    def _write_metadata(self, image_path, xmp_path, description, extracted, jpg_to_update=None):
+        """Écrire le fichier XMP puis, si demandé, les métadonnées du JPG"""
+        self.save_xmp(image_path, xmp_path, description, extracted)
+        
+        if jpg_to_update:
+            keywords_list, scene_desc = extracted
+            if EXIFTOOL_AVAILABLE:
+                success = save_jpg_metadata_with_exiftool(jpg_to_update, keywords_list, scene_desc)
+            else:
+                success = save_jpg_metadata_with_pillow(jpg_to_update, keywords_list, scene_desc)
+            
+            if success:
+                self.add_log(f"Metadata written to JPG file: {jpg_to_update}")
+            else:
+                self.add_log(f"Failed to write metadata to JPG file: {jpg_to_update}")
+
+    def _submit_metadata_write(self, image_path, xmp_path, description, extracted, jpg_to_update=None):
+        """Soumettre l'écriture des métadonnées au pool d'E/S sans bloquer le thread d'analyse"""
+        future = self._io_pool.submit(self._write_metadata, image_path, xmp_path, description, extracted, jpg_to_update)
+        with self._pending_writes_lock:
+            self._pending_writes.add(future)
+            pending = list(self._pending_writes)
+        future.add_done_callback(self._discard_pending_write)
+        
+        # Attendre qu'une écriture se termine si trop d'écritures sont en attente
+        if len(pending) > self._max_pending_writes:
+            concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        return future
+
+    def _discard_pending_write(self, future):
+        """Retirer une écriture terminée de la liste des écritures en attente"""
+        with self._pending_writes_lock:
+            self._pending_writes.discard(future)
+
+    def wait_for_pending_writes(self):
+        """Attendre la fin de toutes les écritures de métadonnées en attente"""
+        with self._pending_writes_lock:
+            pending = list(self._pending_writes)
+        if pending:
+            concurrent.futures.wait(pending)
+
+    def close(self):
+        """Arrêter le traitement, terminer les écritures de métadonnées en attente et libérer les ressources
+        
+        À appeler à la fermeture de l'application : les XMP/JPG en file ne dépendent pas de l'arrêt de l'interpréteur.
+        """
+        self.stop_processing()
+        # Les préparations anticipées peuvent être abandonnées : seules celles en cours sont attendues
+        self._prep_pool.shutdown(wait=True, cancel_futures=True)
+        self._prefetched.clear()
+        self.wait_for_pending_writes()
+        self._io_pool.shutdown(wait=True)
+        self.ollama_client.close()
+
+    def save_xmp(self, image_path, xmp_path, description, extracted=None):
+        """Save description to XMP file
+        
+        extracted: tuple (keywords, scene_description) déjà extrait de description, optionnel
+        """
         try:
-            # Extract keywords from JSON for JPG metadata
-            keywords, scene_description = extract_keywords_from_json(description)
+            # Extract keywords from JSON unless the caller already did it
+            if extracted is not None:
+                keywords, scene_description = extracted
+            else:
+                keywords, scene_description = extract_keywords_from_json(description)
             self.add_log(f"Extracted {len(keywords)} keywords for XMP")
             if scene_description:
                 self.add_log(f"Scene description: {scene_description[:50]}...")
             
+            # Sérialiser le JSON brut une seule fois (réutilisé pour la mise à jour et la création)
+            # Les guillemets du JSON restent tels quels, seuls &, < et > sont échappés pour garder un XML valide
+            description_json = json_dumps(description).translate(_XML_TEXT_ESCAPE)
+            
             # Check if XMP file already exists and we want to preserve settings
             existing_xmp_content = None
-            if self.preserve_xmp and os.path.exists(xmp_path):
+            if self.preserve_xmp:
                 try:
-                    with open(xmp_path, 'r', encoding='utf-8') as f:
-                        existing_xmp_content = f.read()
+                    # Ouverture directe (un seul appel système) : l'absence du fichier est le cas courant
+                    # Lecture binaire décodée d'un bloc : pas de TextIOWrapper, fins de ligne d'origine conservées
+                    with open(xmp_path, 'rb') as f:
+                        existing_xmp_content = f.read().decode('utf-8')
                     self.add_log(f"Existing XMP file found and will be preserved: {xmp_path}")
+                except FileNotFoundError:
+                    pass
                 except Exception as e:
                     self.add_log(f"Cannot read existing XMP file: {str(e)}")
             
+            # Ne rien réécrire si le XMP existant contient déjà exactement la même analyse
+            if existing_xmp_content:
+                existing_keywords = _LIGHTKEYIA_KEYWORDS_RE.search(existing_xmp_content)
+                if existing_keywords and existing_keywords.group(1) == description_json:
+                    self.add_log(f"XMP file already up to date, write skipped: {xmp_path}")
+                    return True
+            
             # Prepare keyword tags in Lightroom format
             keywords_xml = ""
             if keywords:
-                keywords_xml = "<dc:subject>\n            <rdf:Bag>\n"
-                for keyword in keywords:
-                    # Escape XML special characters
-                    keyword = keyword.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace("'", "&apos;")
-                    keywords_xml += f"               <rdf:li>{keyword}</rdf:li>\n"
-                keywords_xml += "            </rdf:Bag>\n         </dc:subject>"
+                # Un seul join sur des enveloppes précalculées, sans formatage par élément
+                keywords_xml = (_DC_SUBJECT_OPEN
+                                + _DC_SUBJECT_ITEM_SEP.join(keyword.translate(_XML_ESCAPE) for keyword in keywords)
+                                + _DC_SUBJECT_CLOSE)
             
             # Prepare description (caption) in Lightroom format
             description_xml = ""
             if scene_description:
                 # Escape XML special characters
-                scene_description = scene_description.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace("'", "&apos;")
-                description_xml = f'<dc:description>\n            <rdf:Alt>\n               <rdf:li xml:lang="x-default">{scene_description}</rdf:li>\n            </rdf:Alt>\n         </dc:description>'
+                scene_description = scene_description.translate(_XML_ESCAPE)
+                description_xml = _DC_DESCRIPTION_OPEN + scene_description + _DC_DESCRIPTION_CLOSE
             
             # If we have existing XMP content and want to preserve it
             if existing_xmp_content and self.preserve_xmp:
                 try:
-                    import re
-                    
                     # Replace description if we have a scene description
                     if scene_description:
-                        desc_pattern = r'<dc:description>.*?</dc:description>'
-                        updated_xmp = re.sub(desc_pattern, description_xml, existing_xmp_content, flags=re.DOTALL)
+                        # Remplacement via une fonction : le texte inséré n'est pas interprété comme un gabarit re
+                        updated_xmp = _DC_DESCRIPTION_RE.sub(lambda m: description_xml, existing_xmp_content)
                     else:
                         updated_xmp = existing_xmp_content
                     
                     # Replace or add keywords
                     if '<dc:subject>' in updated_xmp and keywords:
-                        keywords_pattern = r'<dc:subject>.*?</dc:subject>'
-                        updated_xmp = re.sub(keywords_pattern, keywords_xml, updated_xmp, flags=re.DOTALL)
+                        updated_xmp = _DC_SUBJECT_RE.sub(lambda m: keywords_xml, updated_xmp)
                     elif keywords:
                         # Add keywords before the end of rdf:Description
                         updated_xmp = updated_xmp.replace('</rdf:Description>', f'{keywords_xml}\n         </rdf:Description>')
                     
                     # Replace or add lightkeyia:keywords
                     if '<lightkeyia:keywords>' in updated_xmp:
-                        keywords_pattern = r'<lightkeyia:keywords>.*?</lightkeyia:keywords>'
-                        # Store raw JSON without XML escaping
-                        new_keywords = f'<lightkeyia:keywords>{json.dumps(description)}</lightkeyia:keywords>'
-                        updated_xmp = re.sub(keywords_pattern, new_keywords, updated_xmp, flags=re.DOTALL)
+                        # Store raw JSON (seuls &, < et > sont échappés)
+                        new_keywords = f'<lightkeyia:keywords>{description_json}</lightkeyia:keywords>'
+                        updated_xmp = _LIGHTKEYIA_KEYWORDS_RE.sub(lambda m: new_keywords, updated_xmp)
                     else:
                         # Add lightkeyia namespace if not present
-                        if 'xmlns:lightkeyia="http://lightkeyia.com/ns/1.0/"' not in updated_xmp:
-                            ns_pattern = r'<rdf:Description rdf:about=""([^>]*)>'
-                            ns_replacement = r'<rdf:Description rdf:about=""\1 xmlns:lightkeyia="http://lightkeyia.com/ns/1.0/">'
-                            updated_xmp = re.sub(ns_pattern, ns_replacement, updated_xmp)
+                        if _LIGHTKEYIA_NS_DECL not in updated_xmp:
+                            ns_replacement = r'<rdf:Description rdf:about=""\1 ' + _LIGHTKEYIA_NS_DECL + '>'
+                            updated_xmp = _RDF_DESCRIPTION_OPEN_RE.sub(ns_replacement, updated_xmp)
                         
                         # Add keywords before the end of rdf:Description
-                        keywords_insertion = f'         <lightkeyia:keywords>{json.dumps(description)}</lightkeyia:keywords>\n      '
+                        keywords_insertion = f'         <lightkeyia:keywords>{description_json}</lightkeyia:keywords>\n      '
                         updated_xmp = updated_xmp.replace('</rdf:Description>', f'{keywords_insertion}</rdf:Description>')
                     
                     # Write updated XMP
-                    with open(xmp_path, 'w', encoding='utf-8') as f:
-                        f.write(updated_xmp)
+                    _write_segments(xmp_path, [updated_xmp.encode('utf-8')])
                     
                     self.add_log(f"Updated XMP file preserving existing settings")
                     return True
@@ -742,25 +1014,21 @@ class ImageProcessor:
                     self.add_log("Creating new XMP file without preserving settings")
             
             # Create new XMP file
-            xmp_content = f"""<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 5.5.0">
-   <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
-      <rdf:Description rdf:about=""
-            xmlns:dc="http://purl.org/dc/elements/1.1/"
-            xmlns:xmp="http://ns.adobe.com/xap/1.0/"
-            xmlns:xmpRights="http://ns.adobe.com/xap/1.0/rights/"
-            xmlns:lightkeyia="http://lightkeyia.com/ns/1.0/">
-         {description_xml}
-         {keywords_xml}
-         <xmp:MetadataDate>{datetime.now().strftime("%Y-%m-%dT%H:%M:%S")}</xmp:MetadataDate>
-         <xmpRights:Marked>True</xmpRights:Marked>
-         <lightkeyia:keywords>{json.dumps(description)}</lightkeyia:keywords>
-      </rdf:Description>
-   </rdf:RDF>
-</x:xmpmeta>"""
-            
-            # Write XMP file
-            with open(xmp_path, 'w', encoding='utf-8') as f:
-                f.write(xmp_content)
+            # Seules les parties variables sont encodées, les segments statiques le sont déjà
+            xmp_segments = [
+                _XMP_HEAD,
+                description_xml.encode('utf-8'),
+                _XMP_SEP,
+                keywords_xml.encode('utf-8'),
+                _XMP_DATE_OPEN,
+                datetime.now().strftime("%Y-%m-%dT%H:%M:%S").encode('ascii'),
+                _XMP_DATE_CLOSE,
+                description_json.encode('utf-8'),
+                _XMP_TAIL
+            ]
+            
+            # Write XMP file (écriture vectorisée, sans couche texte ni fsync)
+            _write_segments(xmp_path, xmp_segments)
             
             self.add_log(f"New XMP file saved")
             return True
@@ -774,6 +1042,8 @@ class ImageProcessor:
             self.should_stop = True
             self.paused = False
             self.pause_event.set()  # Réveiller les threads en attente
+            # Les écritures de métadonnées déjà soumises sont terminées par process_directory
+            _dir_index.cache_clear()
             self.add_log("Processing stop requested...")
             return True
         return False
@@ -794,18 +1064,26 @@ class ImageProcessor:
         """Vérifier si le traitement est en pause"""
         return self.paused
 
-    def get_progress(self):
-        """Obtenir l'état actuel du traitement"""
-        # Calculer le temps écoulé
+    def _compute_elapsed_seconds(self):
+        """Calculer le temps de traitement écoulé en secondes, pauses exclues"""
+        if not self.start_time:
+            return 0
+        now = time.monotonic()
+        elapsed_seconds = now - self.start_time - self.total_pause_time
+        # Soustraire la pause en cours
+        if self.paused and self.pause_start_time:
+            elapsed_seconds -= now - self.pause_start_time
+        return max(0, elapsed_seconds)
+
+    def get_progress(self, log_cursor=None):
+        """Obtenir l'état actuel du traitement
+        
+        Avec log_cursor (valeur "logCursor" d'un appel précédent), seuls les logs ajoutés depuis sont renvoyés.
+        """
+        # Calculer le temps écoulé une seule fois (hors pauses)
+        elapsed_seconds = self._compute_elapsed_seconds()
         if self.start_time:
-            elapsed = datetime.now() - self.start_time
-            # Soustraire le temps de pause si on est en pause
-            if self.paused and self.pause_start_time:
-                pause_time = datetime.now() - self.pause_start_time
-                elapsed = elapsed - pause_time
-            # Soustraire le temps total de pause
-            elapsed = elapsed - timedelta(seconds=self.total_pause_time)
-            elapsed_str = str(elapsed).split('.')[0]  # Format HH:MM:SS
+            elapsed_str = str(timedelta(seconds=int(elapsed_seconds)))  # Format HH:MM:SS
         else:
             elapsed_str = "00:00:00"
         
@@ -819,24 +1097,12 @@ class ImageProcessor:
             progress_percent = 0
         
         # Calculer le temps restant estimé
-        if self.is_processing and processed_total > 0 and self.total_images > processed_total:
-            if self.start_time:
-                elapsed_seconds = (datetime.now() - self.start_time).total_seconds() - self.total_pause_time
-                if self.paused and self.pause_start_time:
-                    elapsed_seconds -= (datetime.now() - self.pause_start_time).total_seconds()
-                
-                if elapsed_seconds > 0:
-                    seconds_per_image = elapsed_seconds / processed_total
-                    remaining_images = self.total_images - processed_total
-                    remaining_seconds = seconds_per_image * remaining_images
-                    remaining = timedelta(seconds=int(remaining_seconds))
-                    remaining_str = str(remaining).split('.')[0]  # Format HH:MM:SS
-                else:
-                    remaining_str = "--:--:--"
-            else:
-                remaining_str = "--:--:--"
-        else:
-            remaining_str = "--:--:--"
+        remaining_str = "--:--:--"
+        if self.is_processing and processed_total > 0 and self.total_images > processed_total and elapsed_seconds > 0:
+            seconds_per_image = elapsed_seconds / processed_total
+            remaining_images = self.total_images - processed_total
+            remaining_seconds = seconds_per_image * remaining_images
+            remaining_str = str(timedelta(seconds=int(remaining_seconds)))  # Format HH:MM:SS
         
         # Déterminer le statut
         if not self.is_processing:
@@ -852,12 +1118,22 @@ class ImageProcessor:
         avg_processing_time = 0
         images_per_second = 0
         
-        if self.processing_times:
-            avg_processing_time = sum(self.processing_times) / len(self.processing_times)
+        if self._pt_count:
+            avg_processing_time = self._pt_sum / self._pt_count
             
             if elapsed_seconds > 0:
                 images_per_second = self.processed_images / elapsed_seconds
         
+        # Logs : copie complète de la deque bornée, ou seulement les nouveaux depuis le curseur
+        # (curseur et contenu lus ensemble sous le verrou pour rester cohérents)
+        with self._log_lock:
+            log_seq = self._log_seq
+            if log_cursor is None:
+                logs = list(self.logs)
+            else:
+                new_count = min(log_seq - log_cursor, len(self.logs))
+                logs = list(islice(self.logs, len(self.logs) - new_count, None)) if new_count > 0 else []
+        
         return {
             "status": status,
             "progress": progress_percent,
@@ -865,7 +1141,8 @@ class ImageProcessor:
             "processed": self.processed_images,
             "skipped": self.skipped_images,
             "failed": self.failed_images,
-            "logs": self.logs[-200:] if len(self.logs) > 200 else self.logs,  # Limiter le nombre de logs pour éviter les problèmes de mémoire
+            "logs": logs,
+            "logCursor": log_seq,
             "timeElapsed": elapsed_str,
             "timeRemaining": remaining_str,
             "avgProcessingTime": avg_processing_time,
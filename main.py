@@ -30,7 +30,7 @@ def parse_arguments():
     parser.add_argument("--no-gui", action="store_true", help="Run in command-line mode")
     parser.add_argument("--skip-chat-api", action="store_true", help="Skip chat API and use generate API only")
     parser.add_argument("--timeout", type=int, default=300, help="Request timeout in seconds")
-    parser.add_argument("--load-balancing", default="round_robin", choices=["round_robin", "least_busy", "fastest", "random"], help="Load balancing strategy")
+    parser.add_argument("--load-balancing", default="round_robin", choices=["round_robin", "weighted_round_robin", "least_busy", "fastest", "random", "health_based", "prefix"], help="Load balancing strategy")
     parser.add_argument("--create-containers", action="store_true", help="Create Docker containers")
     parser.add_argument("--container-count", type=int, default=3, help="Number of containers to create")
     parser.add_argument("--container-base-name", default="ollama", help="Base name for containers")
@@ -113,7 +113,11 @@ def run_cli(args):
     logger.info(f"Ollama URLs: {ollama_urls}")
     logger.info(f"Load balancing strategy: {args.load_balancing}")
     
-    processor.process_directory(args.directory, recursive=args.recursive)
+    try:
+        processor.process_directory(args.directory, recursive=args.recursive)
+    finally:
+        # Terminer les écritures de métadonnées en attente avant de quitter
+        processor.close()
     
     logger.info("Processing complete")
 
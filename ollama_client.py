@@ -3,16 +3,89 @@
 LightKeyia - Client Ollama avec support multi-instances
 """
 
-import os
-import json
 import time
-import base64
 import threading
-import tempfile
 import random
+import bisect
+import hashlib
+import math
+import concurrent.futures
 import requests
-from PIL import Image
-from config import logger, RAW_EXTENSIONS, RAWPY_AVAILABLE, DEFAULT_OLLAMA_URL
+from requests.adapters import HTTPAdapter
+from config import logger, DEFAULT_OLLAMA_URL
+from utils import json_dumps, json_dumps_bytes, json_loads, b64encode_str, b64encode_file, get_response_cache_key, load_cached_response, save_cached_response
+
+def _has_valid_json_object(response):
+    """Vérifier que la réponse contient un objet JSON valide (du premier '{' au dernier '}', comme process_image)"""
+    start = response.find('{')
+    end = response.rfind('}')
+    if start == -1 or end <= start:
+        return False
+    try:
+        json_loads(response[start:end+1])
+        return True
+    except ValueError:
+        return False
+
+# Coupe-circuit : après CIRCUIT_FAILURE_THRESHOLD échecs consécutifs, l'instance est écartée CIRCUIT_OPEN_SECONDS
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_OPEN_SECONDS = 30
+# Délai d'établissement de connexion : une instance injoignable échoue vite, quel que soit request_timeout
+CONNECT_TIMEOUT = 5
+
+# Anneau de hachage cohérent pour la stratégie "prefix"
+_RING_REPLICAS = 200  # Points virtuels par instance
+_PREFIX_LOAD_FACTOR = 1.25  # Charge maximale d'une instance, relative à la moyenne
+
+def _ring_hash(text):
+    """Hachage 64 bits stable d'une chaîne (indépendant de PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def _retry_delay(retries):
+    """Délai avant une nouvelle tentative : exponentiel (2 s, 4 s, 8 s... plafonné à 30 s) avec gigue
+    
+    La gigue évite que les threads en échec relancent tous en même temps une instance déjà saturée.
+    """
+    delay = min(30.0, 2.0 ** max(1, retries))
+    return random.uniform(delay / 2, delay)
+
+def _chat_piece(chunk):
+    """Texte d'un fragment de flux /api/chat (ou de la réponse complète)"""
+    return chunk.get('message', {}).get('content', '')
+
+def _generate_piece(chunk):
+    """Texte d'un fragment de flux /api/generate (ou de la réponse complète)"""
+    return chunk.get('response', '')
+
+class _JsonObjectTracker:
+    """Suivre la profondeur des accolades d'un flux de texte pour détecter la fin du premier objet JSON"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+    
+    def feed(self, text):
+        """Ajouter un fragment ; retourne True dès que le premier objet JSON est complet"""
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                # Les guillemets hors objet (texte d'introduction) sont ignorés
+                if self.depth:
+                    self.in_string = True
+            elif ch == '{':
+                self.depth += 1
+            elif ch == '}' and self.depth:
+                self.depth -= 1
+                if not self.depth:
+                    return True
+        return False
 
 class OllamaInstance:
     """Représente une instance d'Ollama avec son URL et ses statistiques"""
@@ -24,19 +97,49 @@ class OllamaInstance:
         self.failed_requests = 0
         self.total_processing_time = 0
         self.last_response_time = 0
+        self.recent_response_time = None  # Moyenne mobile exponentielle des temps de réponse
         self.is_available = True
-        self.last_check_time = 0
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0  # time.monotonic() jusqu'auquel l'instance est écartée
+        self.last_check_time = 0  # time.monotonic() de la dernière vérification (0 : jamais)
         self.models = []
         self.semaphore = None  # Sera initialisé par OllamaClient
+        self.capacity = 1  # Nombre de permis du sémaphore, fixé par OllamaClient
+        self._stats_lock = threading.Lock()  # Mises à jour des statistiques depuis plusieurs threads
     
     def update_stats(self, success, response_time):
-        """Mettre à jour les statistiques de l'instance"""
-        self.total_requests += 1
-        self.last_response_time = response_time
-        self.total_processing_time += response_time
-        
-        if not success:
-            self.failed_requests += 1
+        """Mettre à jour les statistiques de l'instance
+        
+        response_time en secondes (float, mesuré avec time.monotonic) : une mesure par requête de
+        plusieurs secondes, des entiers en nanosecondes n'apporteraient rien de mesurable.
+        """
+        with self._stats_lock:
+            self.total_requests += 1
+            self.last_response_time = response_time
+            self.total_processing_time += response_time
+            if self.recent_response_time is None:
+                self.recent_response_time = response_time
+            else:
+                self.recent_response_time = 0.8 * self.recent_response_time + 0.2 * response_time
+            
+            if not success:
+                self.failed_requests += 1
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    if not self.is_circuit_open():
+                        logger.warning(f"Instance {self.url} failed {self.consecutive_failures} times in a row, skipped for {CIRCUIT_OPEN_SECONDS}s")
+                    self.circuit_open_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+            else:
+                self.close_circuit()
+    
+    def is_circuit_open(self):
+        """Indiquer si l'instance est temporairement écartée après des échecs consécutifs"""
+        return time.monotonic() < self.circuit_open_until
+    
+    def close_circuit(self):
+        """Réintégrer l'instance (requête réussie ou vérification de santé positive)"""
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0
     
     def get_average_response_time(self):
         """Obtenir le temps de réponse moyen"""
@@ -44,6 +147,16 @@ class OllamaInstance:
             return self.total_processing_time / self.total_requests
         return 0
     
+    def get_expected_wait(self, min_response_time=0.0):
+        """Estimer le temps avant qu'une nouvelle requête soit servie (file actuelle incluse)
+        
+        min_response_time : plancher du temps de réponse, pour qu'une instance sans historique reste départagée par sa file.
+        """
+        response_time = self.recent_response_time
+        if response_time is None:
+            response_time = self.get_average_response_time()
+        return (self.active_requests + 1) * max(response_time, min_response_time)
+    
     def get_success_rate(self):
         """Obtenir le taux de succès"""
         if self.total_requests > 0:
@@ -61,7 +174,7 @@ class OllamaInstance:
         # 3. Son taux d'échec récent est élevé
         
         # Vérifier le nombre de requêtes actives
-        if self.active_requests >= self.semaphore._value * 0.8:  # 80% de la capacité maximale
+        if self.active_requests * 5 >= self.capacity * 4:  # 80% de la capacité maximale
             return True
         
         # Vérifier le temps de réponse récent (si disponible)
@@ -84,8 +197,8 @@ class OllamaInstance:
         score = 100
         
         # Pénalité pour les requêtes actives
-        if self.semaphore._value > 0:  # Éviter division par zéro
-            active_ratio = self.active_requests / self.semaphore._value
+        if self.capacity > 0:  # Éviter division par zéro
+            active_ratio = self.active_requests / self.capacity
             score -= active_ratio * 40  # Jusqu'à -40 points
         
         # Pénalité pour le temps de réponse
@@ -122,61 +235,128 @@ class OllamaClient:
         # Initialiser les sémaphores pour chaque instance
         for instance in self.instances:
             instance.semaphore = threading.Semaphore(self.max_concurrent_requests)
+            instance.capacity = self.max_concurrent_requests
         
         # Stratégie de répartition de charge
-        self.load_balancing_strategy = "round_robin"  # "round_robin", "least_busy", "random", "fastest"
+        self.load_balancing_strategy = "round_robin"  # "round_robin", "weighted_round_robin", "least_busy", "random", "fastest", "health_based", "prefix"
         self.current_instance_index = 0  # Pour la stratégie round-robin
+        self._wrr_current = {}  # Poids courants du round-robin pondéré lissé (instance -> poids)
+        # Anneau (hachages triés, instances) pour la stratégie "prefix"
+        ring = sorted((_ring_hash(f"{instance.url}#{i}"), instance) for instance in self.instances for i in range(_RING_REPLICAS))
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_instances = [instance for _, instance in ring]
+        # Protège le choix de l'instance, l'index round-robin et les compteurs active_requests.
+        # Un seul verrou suffit : avec quelques instances, le parcours en O(n) de la sélection
+        # coûte quelques microsecondes, négligeable devant une génération de plusieurs secondes.
+        self._lb_lock = threading.Lock()
+        
+        # Timer de réinitialisation périodique des statistiques (voir auto_reset_stats)
+        self._reset_timer = None
+        self._reset_interval = None
+        
+        # Cache TTL (timestamp, valeur) pour is_ollama_running et list_models
+        self.status_cache_ttl = 5.0  # secondes
+        self._running_cache = None
+        self._models_cache = None
+        
+        # Session HTTP persistante : réutilise les connexions (keep-alive) vers les instances
+        # (une seule session suffit : l'adaptateur tient un pool de connexions distinct par hôte)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         
         # Vérifier la disponibilité des instances
         self._check_instances()
     
-    def _check_instances(self):
-        """Vérifier la disponibilité de toutes les instances"""
-        for instance in self.instances:
-            try:
-                response = requests.get(f"{instance.url}", timeout=5)
-                instance.is_available = response.status_code == 200
-                instance.last_check_time = time.time()
-                
-                if instance.is_available:
-                    # Récupérer la liste des modèles disponibles
-                    try:
-                        models_response = requests.get(f"{instance.url}/api/tags", timeout=10)
-                        if models_response.status_code == 200:
-                            instance.models = [model.get('name', '') for model in models_response.json().get('models', [])]
-                    except:
-                        instance.models = []
-                
-                logger.info(f"Instance Ollama {instance.url}: {'Available' if instance.is_available else 'Unavailable'}")
-            except Exception as e:
-                instance.is_available = False
-                logger.error(f"Error checking Ollama instance {instance.url}: {str(e)}")
+    def close(self):
+        """Fermer les connexions keep-alive de la session HTTP et arrêter le Timer de statistiques"""
+        if self._reset_timer is not None:
+            self._reset_timer.cancel()
+            self._reset_timer = None
+        self._reset_interval = None
+        self.session.close()
+    
+    def _map_instances(self, func, instances):
+        """Appliquer func à chaque instance en parallèle (appels HTTP indépendants), résultats dans l'ordre
+        
+        Le temps total est celui de l'instance la plus lente plutôt que la somme des délais.
+        """
+        if len(instances) <= 1:
+            return [func(instance) for instance in instances]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(instances), thread_name_prefix="ollama-fanout") as executor:
+            return list(executor.map(func, instances))
+    
+    def _check_instances(self, force=False):
+        """Vérifier la disponibilité de toutes les instances
+        
+        Sans force, une instance vérifiée disponible il y a moins de status_cache_ttl secondes n'est pas sondée à nouveau.
+        """
+        self._map_instances(lambda instance: self._check_instance(instance, force), self.instances)
+    
+    def _check_instance(self, instance, force=False):
+        """Vérifier la disponibilité d'une instance et récupérer ses modèles"""
+        if not force and instance.is_available and instance.last_check_time and time.monotonic() - instance.last_check_time < self.status_cache_ttl:
+            return
+        try:
+            # HEAD suffit pour la vivacité : Ollama répond 200 sur / sans corps à transférer
+            response = self.session.head(f"{instance.url}", timeout=5)
+            instance.is_available = response.status_code == 200
+            instance.last_check_time = time.monotonic()
+            if instance.is_available:
+                instance.close_circuit()
+            
+            if instance.is_available:
+                # Récupérer la liste des modèles disponibles
+                try:
+                    models_response = self.session.get(f"{instance.url}/api/tags", timeout=10)
+                    if models_response.status_code == 200:
+                        instance.models = [model.get('name', '') for model in json_loads(models_response.content).get('models', [])]
+                except:
+                    instance.models = []
+            
+            logger.info(f"Instance Ollama {instance.url}: {'Available' if instance.is_available else 'Unavailable'}")
+        except Exception as e:
+            instance.is_available = False
+            logger.error(f"Error checking Ollama instance {instance.url}: {str(e)}")
     
     def reset_instance_stats(self, instance=None):
         """Réinitialiser les statistiques d'une instance ou de toutes les instances"""
-        if instance:
-            instance.total_requests = 0
-            instance.failed_requests = 0
-            instance.total_processing_time = 0
-            logger.info(f"Statistics reset for instance {instance.url}")
-        else:
-            for inst in self.instances:
+        for inst in ([instance] if instance else self.instances):
+            with inst._stats_lock:
                 inst.total_requests = 0
                 inst.failed_requests = 0
                 inst.total_processing_time = 0
+                inst.recent_response_time = None
+        
+        if instance:
+            logger.info(f"Statistics reset for instance {instance.url}")
+        else:
             logger.info("Statistics reset for all instances")
     
     def auto_reset_stats(self, interval=3600):
-        """Démarrer un thread pour réinitialiser automatiquement les statistiques"""
-        def reset_thread():
-            while True:
-                time.sleep(interval)
-                self.reset_instance_stats()
-        
-        thread = threading.Thread(target=reset_thread, daemon=True)
-        thread.start()
+        """Réinitialiser automatiquement les statistiques toutes les interval secondes
+        
+        Timer réarmé à chaque échéance : il s'annule dans close(), contrairement à une boucle de sommeil.
+        """
+        self._reset_interval = interval
+        self._arm_reset_timer()
         logger.info(f"Auto-reset of instance statistics enabled (interval: {interval}s)")
     
+    def _arm_reset_timer(self):
+        """Programmer la prochaine réinitialisation des statistiques"""
+        if self._reset_timer is not None:
+            self._reset_timer.cancel()
+        self._reset_timer = threading.Timer(self._reset_interval, self._reset_timer_tick)
+        self._reset_timer.daemon = True
+        self._reset_timer.start()
+    
+    def _reset_timer_tick(self):
+        """Échéance du Timer : réinitialiser puis réarmer"""
+        self.reset_instance_stats()
+        if self._reset_interval is not None:  # Pas de réarmement après close()
+            self._arm_reset_timer()
+    
     def get_available_instances(self):
         """Obtenir la liste des instances disponibles"""
         return [instance for instance in self.instances if instance.is_available]
@@ -192,331 +372,421 @@ class OllamaClient:
         
         return instances_with_model if instances_with_model else available_instances
     
-    def _select_instance(self, model_name=None):
-        """Sélectionner une instance selon la stratégie de répartition de charge"""
+    def _select_instance(self, model_name=None, affinity_key=None):
+        """Sélectionner une instance selon la stratégie de répartition de charge
+        
+        affinity_key : clé (modèle + prompt système) utilisée par la stratégie "prefix".
+        """
         available_instances = self.get_instance_for_model(model_name) if model_name else self.get_available_instances()
         
         if not available_instances:
             logger.error("No available Ollama instances")
             return None
         
+        # Écarter les instances dont le coupe-circuit est ouvert (toutes gardées si aucune n'est fermée)
+        available_instances = [i for i in available_instances if not i.is_circuit_open()] or available_instances
+        
         # Filtrer les instances surchargées si possible
         healthy_instances = [i for i in available_instances if not i.is_overloaded()]
         
-        # S'il n'y a pas d'instances saines, utiliser toutes les instances disponibles
-        # mais ajouter une pause pour donner du temps aux instances de récupérer
-        if not healthy_instances and len(available_instances) > 0:
-            logger.warning("All instances are overloaded, adding a recovery pause")
-            time.sleep(2)  # Pause de récupération
-            instances_to_use = available_instances
-        else:
-            instances_to_use = healthy_instances if healthy_instances else available_instances
+        # S'il n'y a pas d'instances saines, utiliser toutes les instances disponibles :
+        # la requête attendra son tour sur le sémaphore de l'instance choisie (file bornée). Le sémaphore
+        # réveille l'attente dès qu'une requête libère son créneau : pas de pause fixe ni de condition à notifier.
+        if not healthy_instances:
+            logger.warning("All instances are overloaded, queuing on the selected instance")
+        instances_to_use = healthy_instances or available_instances
+        
+        # Choix et réservation atomiques : deux threads ne voient pas la même file comme vide
+        with self._lb_lock:
+            selected_instance = self._pick_instance(instances_to_use, affinity_key)
+            selected_instance.active_requests += 1
         
-        selected_instance = None
+        # Log détaillé de la sélection d'instance
+        logger.info(f"Selected instance {selected_instance.url} using strategy '{self.load_balancing_strategy}' (active: {selected_instance.active_requests}, total: {selected_instance.total_requests})")
+        
+        return selected_instance
+    
+    def _pick_instance(self, instances_to_use, affinity_key=None):
+        """Appliquer la stratégie de répartition (appelé sous _lb_lock)"""
+        if self.load_balancing_strategy == "prefix" and affinity_key is not None:
+            selected_instance = self._pick_instance_by_prefix(instances_to_use, affinity_key)
         
-        if self.load_balancing_strategy == "round_robin":
+        elif self.load_balancing_strategy in ("round_robin", "prefix"):
             # Stratégie round-robin
             selected_instance = instances_to_use[self.current_instance_index % len(instances_to_use)]
             self.current_instance_index += 1
         
+        elif self.load_balancing_strategy == "weighted_round_robin":
+            selected_instance = self._pick_instance_weighted(instances_to_use)
+        
         elif self.load_balancing_strategy == "least_busy":
-            # Sélectionner l'instance la moins occupée
-            selected_instance = min(instances_to_use, key=lambda x: x.active_requests)
+            # Moindre latence en attente : requêtes actives (attente incluse) x temps de réponse récent.
+            # Une instance lente avec une seule requête peut être plus chargée qu'une rapide avec trois.
+            selected_instance = min(instances_to_use, key=lambda x: (x.get_expected_wait(min_response_time=0.05), x.active_requests))
         
         elif self.load_balancing_strategy == "fastest":
-            # Sélectionner l'instance avec le temps de réponse moyen le plus rapide
-            # Exclure les instances sans historique
-            instances_with_history = [i for i in instances_to_use if i.total_requests > 0]
-            if instances_with_history:
-                selected_instance = min(instances_with_history, key=lambda x: x.get_average_response_time())
+            # Essayer d'abord les instances sans historique pour mesurer leur temps de réponse
+            instances_without_history = [i for i in instances_to_use if i.recent_response_time is None and i.total_requests == 0]
+            if instances_without_history:
+                selected_instance = min(instances_without_history, key=lambda x: x.active_requests)
             else:
-                # Si aucune instance n'a d'historique, utiliser round-robin
-                selected_instance = instances_to_use[self.current_instance_index % len(instances_to_use)]
-                self.current_instance_index += 1
+                # Temps de réponse récent pondéré par la file : une instance rapide mais saturée cède la place
+                selected_instance = min(instances_to_use, key=lambda x: x.get_expected_wait())
         
         elif self.load_balancing_strategy == "health_based":
-            # Nouvelle stratégie basée sur le score de santé
-            # Calculer les scores de santé pour toutes les instances
-            instances_with_scores = [(i, i.get_health_score()) for i in instances_to_use]
-            
-            # Trier par score de santé (du plus élevé au plus bas)
-            instances_with_scores.sort(key=lambda x: x[1], reverse=True)
-            
             # Sélectionner l'instance avec le meilleur score de santé
-            if instances_with_scores:
-                selected_instance = instances_with_scores[0][0]
-            else:
-                # Fallback à round-robin si aucune instance n'a de score
-                selected_instance = instances_to_use[self.current_instance_index % len(instances_to_use)]
-                self.current_instance_index += 1
+            selected_instance = max(instances_to_use, key=lambda x: x.get_health_score())
         
         else:  # "random" ou autre
             # Sélection aléatoire
             selected_instance = random.choice(instances_to_use)
         
-        # Log détaillé de la sélection d'instance
-        if selected_instance:
-            logger.info(f"Selected instance {selected_instance.url} using strategy '{self.load_balancing_strategy}' (active: {selected_instance.active_requests}, total: {selected_instance.total_requests})")
-        
         return selected_instance
     
+    def _pick_instance_weighted(self, instances_to_use):
+        """Round-robin pondéré lissé (à la nginx) : chaque instance reçoit une part des requêtes
+        proportionnelle à l'inverse de son temps de réponse récent, sans rafales sur une même instance"""
+        times = [i.recent_response_time for i in instances_to_use]
+        known = [t for t in times if t]
+        fastest = min(known) if known else 1.0
+        # Poids entiers de 1 à 10 ; une instance sans historique reçoit le poids maximal pour être mesurée
+        weights = [max(1, round(10 * fastest / t)) if t else 10 for t in times]
+        
+        total = sum(weights)
+        best, best_weight = None, None
+        for instance, weight in zip(instances_to_use, weights):
+            current = self._wrr_current.get(instance, 0) + weight
+            self._wrr_current[instance] = current
+            if best_weight is None or current > best_weight:
+                best, best_weight = instance, current
+        self._wrr_current[best] -= total
+        return best
+    
+    def _pick_instance_by_prefix(self, instances_to_use, affinity_key):
+        """Hachage cohérent à charge bornée : les requêtes partageant le même prompt système vont
+        à la même instance (cache KV du préfixe réutilisé par Ollama) tant qu'elle n'est pas saturée"""
+        candidates = set(instances_to_use)
+        total_active = sum(i.active_requests for i in instances_to_use)
+        max_load = math.ceil(_PREFIX_LOAD_FACTOR * (total_active + 1) / len(instances_to_use))
+        
+        start = bisect.bisect_right(self._ring_hashes, _ring_hash(affinity_key))
+        ring_size = len(self._ring_instances)
+        seen = set()
+        for offset in range(ring_size):
+            instance = self._ring_instances[(start + offset) % ring_size]
+            if instance in seen:
+                continue
+            seen.add(instance)
+            if instance in candidates and instance.active_requests < max_load:
+                return instance
+            if len(seen) == len(self.instances):
+                break
+        
+        # Toutes les instances sont au-dessus de la borne : repli sur la moins occupée
+        return min(instances_to_use, key=lambda x: x.active_requests)
+    
+    def _release_instance(self, instance):
+        """Libérer la réservation prise par _select_instance"""
+        with self._lb_lock:
+            instance.active_requests -= 1
+    
+    def _get_cached(self, cache):
+        """Retourner la valeur d'un cache (timestamp, valeur) si elle n'a pas expiré, sinon None"""
+        if cache is not None and time.monotonic() - cache[0] < self.status_cache_ttl:
+            return cache[1]
+        return None
+    
+    def invalidate_status_cache(self):
+        """Forcer la prochaine vérification des instances et des modèles"""
+        self._running_cache = None
+        self._models_cache = None
+    
     def is_ollama_running(self):
         """Vérifier si au moins une instance d'Ollama est disponible"""
+        cached = self._get_cached(self._running_cache)
+        if cached is not None:
+            return cached
+        
         self._check_instances()
-        return len(self.get_available_instances()) > 0
+        running = len(self.get_available_instances()) > 0
+        self._running_cache = (time.monotonic(), running)
+        return running
     
     def list_models(self):
         """Lister tous les modèles disponibles sur toutes les instances"""
-        all_models = []
+        cached = self._get_cached(self._models_cache)
+        if cached is not None:
+            return list(cached)
         
-        for instance in self.get_available_instances():
-            try:
-                response = requests.get(f"{instance.url}/api/tags", timeout=10)
-                if response.status_code == 200:
-                    models = response.json().get('models', [])
-                    all_models.extend(models)
-            except Exception as e:
-                logger.error(f"Error listing models from {instance.url}: {str(e)}")
+        # Interroger les instances en parallèle (ordre des instances conservé)
+        per_instance = self._map_instances(self._fetch_models, self.get_available_instances())
         
         # Éliminer les doublons en conservant les métadonnées
         unique_models = {}
-        for model in all_models:
+        for model in (model for models in per_instance for model in models):
             name = model.get('name', '')
             if name and name not in unique_models:
                 unique_models[name] = model
         
-        return list(unique_models.values())
+        models = list(unique_models.values())
+        self._models_cache = (time.monotonic(), models)
+        return list(models)
+    
+    def _fetch_models(self, instance):
+        """Lister les modèles d'une instance (liste vide en cas d'erreur)"""
+        try:
+            response = self.session.get(f"{instance.url}/api/tags", timeout=10)
+            if response.status_code == 200:
+                return json_loads(response.content).get('models', [])
+        except Exception as e:
+            logger.error(f"Error listing models from {instance.url}: {str(e)}")
+        return []
     
     def load_model(self, model_name):
-        """Précharger un modèle sur toutes les instances disponibles"""
-        success = False
-        
-        for instance in self.get_available_instances():
-            try:
-                # Vérifier si le modèle est déjà téléchargé sur cette instance
-                if instance.models and model_name in instance.models:
-                    logger.info(f"Modèle {model_name} déjà disponible sur {instance.url}")
-                    success = True
-                    continue
-                
-                logger.info(f"Préchargement du modèle {model_name} sur {instance.url}...")
-                
-                # Télécharger le modèle si nécessaire
-                pull_response = requests.post(
-                    f"{instance.url}/api/pull",
-                    json={"name": model_name},
-                    timeout=600  # Timeout plus long pour le téléchargement
-                )
-                
-                if pull_response.status_code != 200:
-                    logger.error(f"Erreur lors du téléchargement du modèle sur {instance.url}: {pull_response.status_code}")
-                    continue
-                
-                # Initialiser le modèle avec une requête simple
-                response = requests.post(
-                    f"{instance.url}/api/generate",
-                    json={
-                        "model": model_name,
-                        "prompt": "Hello",
-                        "stream": False
-                    },
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    logger.info(f"Modèle {model_name} chargé sur {instance.url}")
-                    # Ajouter le modèle à la liste des modèles disponibles
-                    if model_name not in instance.models:
-                        instance.models.append(model_name)
-                    success = True
-                else:
-                    logger.error(f"Erreur lors de l'initialisation du modèle sur {instance.url}: {response.status_code}")
-            except Exception as e:
-                logger.error(f"Exception lors du chargement du modèle sur {instance.url}: {str(e)}")
-        
-        return success
+        """Précharger un modèle sur toutes les instances disponibles (en parallèle)"""
+        results = self._map_instances(lambda instance: self._load_model_on(instance, model_name), self.get_available_instances())
+        return any(results)
     
-    def generate(self, model, prompt, system_prompt=None, temperature=0.5, max_retries=3, request_timeout=60):
-        """Generate text with Ollama using load balancing"""
-        retries = 0
-        
-        while retries < max_retries:
-            # Sélectionner une instance selon la stratégie de répartition
-            instance = self._select_instance(model)
+    def _load_model_on(self, instance, model_name):
+        """Télécharger si besoin puis initialiser un modèle sur une instance"""
+        try:
+            # Vérifier si le modèle est déjà téléchargé sur cette instance
+            if instance.models and model_name in instance.models:
+                logger.info(f"Modèle {model_name} déjà disponible sur {instance.url}")
+                return True
             
-            if not instance:
-                logger.error("No available Ollama instances for generation")
-                return None
+            logger.info(f"Préchargement du modèle {model_name} sur {instance.url}...")
             
-            start_time = time.time()
-            success = False
+            # Télécharger le modèle si nécessaire
+            pull_response = self.session.post(
+                f"{instance.url}/api/pull",
+                data=json_dumps_bytes({"name": model_name}),
+                headers={"Content-Type": "application/json"},
+                timeout=600  # Timeout plus long pour le téléchargement
+            )
             
-            try:
-                # Acquérir le sémaphore pour limiter la concurrence
-                acquired = instance.semaphore.acquire(timeout=30)  # Attendre jusqu'à 30 secondes
-                if not acquired:
-                    logger.warning(f"Impossible d'acquérir le sémaphore pour {instance.url} après 30 secondes, nouvelle tentative...")
-                    retries += 1
-                    continue
-                
-                # Incrémenter le compteur de requêtes actives
-                instance.active_requests += 1
-                
-                try:
-                    payload = {
-                        "model": model,
-                        "prompt": prompt,
-                        "temperature": temperature,
-                        "stream": False
-                    }
-                    
-                    if system_prompt:
-                        payload["system"] = system_prompt
-                    
-                    logger.info(f"Envoi de la requête à {instance.url} avec le modèle {model} (tentative {retries+1}/{max_retries})")
-                    
-                    # Utiliser un en-tête keep-alive pour maintenir la connexion
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Connection": "keep-alive"
-                    }
-                    
-                    response = requests.post(
-                        f"{instance.url}/api/generate",
-                        json=payload,
-                        headers=headers,
-                        timeout=request_timeout
-                    )
-                    
-                    response_time = time.time() - start_time
-                    
-                    if response.status_code == 200:
-                        success = True
-                        instance.update_stats(True, response_time)
-                        return response.json().get('response', '')
-                    else:
-                        logger.error(f"Error generating text on {instance.url}: {response.status_code} - {response.text}")
-                        instance.update_stats(False, response_time)
-                        retries += 1
-                        time.sleep(2)  # Wait before retrying
-                finally:
-                    # Décrémenter le compteur de requêtes actives
-                    instance.active_requests -= 1
-                    # Toujours libérer le sémaphore
-                    instance.semaphore.release()
-            except Exception as e:
-                response_time = time.time() - start_time
-                instance.update_stats(False, response_time)
-                logger.error(f"Exception generating text on {instance.url}: {str(e)}")
-                retries += 1
-                time.sleep(2)  # Wait before retrying
-                # S'assurer que le sémaphore est libéré en cas d'exception
-                try:
-                    instance.active_requests -= 1
-                    instance.semaphore.release()
-                except:
-                    pass
-        
-        return None
+            if pull_response.status_code != 200:
+                logger.error(f"Erreur lors du téléchargement du modèle sur {instance.url}: {pull_response.status_code}")
+                return False
+            
+            # Initialiser le modèle avec une requête simple
+            response = self.session.post(
+                f"{instance.url}/api/generate",
+                data=json_dumps_bytes({
+                    "model": model_name,
+                    "prompt": "Hello",
+                    "stream": False
+                }),
+                headers={"Content-Type": "application/json"},
+                timeout=30
+            )
+            
+            if response.status_code == 200:
+                logger.info(f"Modèle {model_name} chargé sur {instance.url}")
+                # Ajouter le modèle à la liste des modèles disponibles
+                if model_name not in instance.models:
+                    instance.models.append(model_name)
+                self._models_cache = None
+                return True
+            else:
+                logger.error(f"Erreur lors de l'initialisation du modèle sur {instance.url}: {response.status_code}")
+        except Exception as e:
+            logger.error(f"Exception lors du chargement du modèle sur {instance.url}: {str(e)}")
+        return False
     
-    def chat(self, model, messages, temperature=0.5, max_retries=3, request_timeout=60):
-        """Chat with Ollama using load balancing"""
+    def generate(self, model, prompt, system_prompt=None, temperature=0.5, max_retries=3, request_timeout=60, stop_after_json=False,
+                 response_format=None):
+        """Generate text with Ollama using load balancing
+        
+        stop_after_json : recevoir la réponse en flux et couper dès que le premier objet JSON est complet.
+        response_format : champ "format" d'Ollama ("json" ou schéma JSON) pour contraindre la sortie du modèle.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "temperature": temperature,
+            "stream": stop_after_json
+        }
+        
+        if system_prompt:
+            payload["system"] = system_prompt
+        if response_format:
+            payload["format"] = response_format
+        
+        return self._request_with_retries(
+            "/api/generate", payload, f"{model}\n{system_prompt or ''}",
+            _generate_piece, max_retries, request_timeout, stop_after_json,
+            ("generation", "la requête", "generating text")
+        )
+    
+    def chat(self, model, messages, temperature=0.5, max_retries=3, request_timeout=60, stop_after_json=False,
+             response_format=None):
+        """Chat with Ollama using load balancing
+        
+        stop_after_json : recevoir la réponse en flux et couper dès que le premier objet JSON est complet.
+        response_format : champ "format" d'Ollama ("json" ou schéma JSON) pour contraindre la sortie du modèle.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "stream": stop_after_json
+        }
+        if response_format:
+            payload["format"] = response_format
+        
+        # Clé d'affinité : le modèle et le message système, préfixe commun à toutes les images
+        system_messages = [m.get('content', '') for m in messages if m.get('role') == 'system']
+        affinity_key = f"{model}\n{system_messages[0] if system_messages else ''}"
+        
+        return self._request_with_retries(
+            "/api/chat", payload, affinity_key,
+            _chat_piece, max_retries, request_timeout, stop_after_json,
+            ("chat", "la requête chat", "chatting")
+        )
+    
+    def _request_with_retries(self, endpoint, payload, affinity_key, extract_piece, max_retries, request_timeout, stop_after_json, labels):
+        """Envoyer une requête à une instance choisie par la répartition de charge, avec nouvelles tentatives
+        
+        extract_piece extrait le texte d'un fragment (ou de la réponse complète) de l'endpoint ;
+        labels : (usage, requête, action) pour les messages de log de generate et chat.
+        """
+        usage, request_label, action = labels
+        model = payload["model"]
+        # Corps sérialisé une seule fois, directement en octets (orjson si disponible) plutôt que par requests
+        body = json_dumps_bytes(payload)
+        # Utiliser un en-tête keep-alive pour maintenir la connexion
+        headers = {
+            "Content-Type": "application/json",
+            "Connection": "keep-alive"
+        }
         retries = 0
         
         while retries < max_retries:
             # Sélectionner une instance selon la stratégie de répartition
-            instance = self._select_instance(model)
+            instance = self._select_instance(model, affinity_key)
             
             if not instance:
-                logger.error("No available Ollama instances for chat")
+                logger.error(f"No available Ollama instances for {usage}")
                 return None
             
-            start_time = time.time()
-            success = False
+            start_time = time.monotonic()
             
             try:
-                # Acquérir le sémaphore pour limiter la concurrence
-                acquired = instance.semaphore.acquire(timeout=30)  # Attendre jusqu'à 30 secondes
+                # Attendre un créneau sur l'instance réservée plutôt que de rebondir entre instances :
+                # les requêtes en cours se terminent au plus tard après request_timeout
+                acquired = instance.semaphore.acquire(timeout=request_timeout)
                 if not acquired:
-                    logger.warning(f"Impossible d'acquérir le sémaphore pour {instance.url} après 30 secondes, nouvelle tentative...")
+                    logger.warning(f"Impossible d'acquérir le sémaphore pour {instance.url} après {request_timeout} secondes, nouvelle tentative...")
                     retries += 1
                     continue
-                
-                # Incrémenter le compteur de requêtes actives
-                instance.active_requests += 1
+                # Le temps passé en file ne compte pas dans le temps de réponse de l'instance
+                start_time = time.monotonic()
                 
                 try:
-                    payload = {
-                        "model": model,
-                        "messages": messages,
-                        "temperature": temperature,
-                        "stream": False
-                    }
-                    
-                    logger.info(f"Envoi de la requête chat à {instance.url} avec le modèle {model} (tentative {retries+1}/{max_retries})")
+                    logger.info(f"Envoi de {request_label} à {instance.url} avec le modèle {model} (tentative {retries+1}/{max_retries})")
                     
-                    # Utiliser un en-tête keep-alive pour maintenir la connexion
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Connection": "keep-alive"
-                    }
-                    
-                    response = requests.post(
-                        f"{instance.url}/api/chat",
-                        json=payload,
+                    response = self.session.post(
+                        f"{instance.url}{endpoint}",
+                        data=body,
                         headers=headers,
-                        timeout=request_timeout
+                        timeout=(CONNECT_TIMEOUT, request_timeout),
+                        stream=stop_after_json
                     )
                     
-                    response_time = time.time() - start_time
-                    
                     if response.status_code == 200:
-                        success = True
-                        instance.update_stats(True, response_time)
-                        return response.json().get('message', {}).get('content', '')
+                        if stop_after_json:
+                            content = self._read_stream_until_json(response, extract_piece)
+                        else:
+                            content = extract_piece(json_loads(response.content))
+                        instance.update_stats(True, time.monotonic() - start_time)
+                        return content
                     else:
-                        logger.error(f"Error chatting on {instance.url}: {response.status_code} - {response.text}")
-                        instance.update_stats(False, response_time)
+                        logger.error(f"Error {action} on {instance.url}: {response.status_code} - {response.text}")
+                        instance.update_stats(False, time.monotonic() - start_time)
                         retries += 1
-                        time.sleep(2)  # Wait before retrying
+                        time.sleep(_retry_delay(retries))  # Wait before retrying
                 finally:
-                    # Décrémenter le compteur de requêtes actives
-                    instance.active_requests -= 1
                     # Toujours libérer le sémaphore
                     instance.semaphore.release()
             except Exception as e:
-                response_time = time.time() - start_time
+                response_time = time.monotonic() - start_time
                 instance.update_stats(False, response_time)
-                logger.error(f"Exception chatting on {instance.url}: {str(e)}")
+                logger.error(f"Exception {action} on {instance.url}: {str(e)}")
                 retries += 1
-                time.sleep(2)  # Wait before retrying
-                # S'assurer que le sémaphore est libéré en cas d'exception
-                try:
-                    instance.active_requests -= 1
-                    instance.semaphore.release()
-                except:
-                    pass
+                time.sleep(_retry_delay(retries))  # Wait before retrying
+            finally:
+                # Libérer la réservation prise à la sélection (le sémaphore est libéré plus haut)
+                self._release_instance(instance)
         
         return None
     
-    def _encode_image_to_base64(self, image_path):
-        """Encode image to base64"""
+    def _read_stream_until_json(self, response, extract_piece):
+        """Lire une réponse Ollama en flux et s'arrêter dès que le premier objet JSON est complet
+        
+        extract_piece extrait le texte d'un fragment (/api/chat : message.content, /api/generate : response).
+        Fermer la connexion plus tôt interrompt la génération côté Ollama (texte superflu après le JSON).
+        """
+        tracker = _JsonObjectTracker()
+        pieces = []
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json_loads(line)
+                piece = extract_piece(chunk)
+                if piece:
+                    pieces.append(piece)
+                    if tracker.feed(piece):
+                        break
+                if chunk.get('done'):
+                    break
+        finally:
+            response.close()
+        return "".join(pieces)
+    
+    def _encode_image_to_base64(self, image):
+        """Encode image to base64 (chemin de fichier ou octets déjà en mémoire)"""
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                return b64encode_str(image)
+            return b64encode_file(image)
         except Exception as e:
             logger.error(f"Error encoding image: {str(e)}")
             return None
     
     def generate_with_image(self, model, image_path, system_prompt=None, user_prompt=None, 
-                           temperature=0.5, max_retries=3, request_timeout=60, skip_chat_api=False):
-        """Generate text with image using Ollama with load balancing"""
+                           temperature=0.5, max_retries=3, request_timeout=60, skip_chat_api=False,
+                           use_cache=True, stop_after_json=False, response_format=None):
+        """Generate text with image using Ollama with load balancing
+        
+        image_path peut être un chemin de fichier ou les octets JPEG déjà préparés en mémoire.
+        Avec use_cache, une réponse déjà obtenue pour le même modèle, les mêmes prompts et la même image est réutilisée.
+        Avec stop_after_json, la réponse (chat ou generate) est lue en flux et coupée après le premier objet JSON.
+        response_format est transmis tel quel comme champ "format" d'Ollama (sortie contrainte, ex. "json") et fait partie de la clé du cache.
+        """
         try:
             # Encode image to base64
             base64_image = self._encode_image_to_base64(image_path)
             if not base64_image:
                 return None
             
+            # Réutiliser une réponse déjà obtenue pour la même entrée
+            cache_key = None
+            if use_cache:
+                # Tous les paramètres qui changent la réponse font partie de la clé (endpoint, température,
+                # coupure du flux, format contraint)
+                format_key = response_format if response_format is None or isinstance(response_format, str) else json_dumps(response_format)
+                cache_key = get_response_cache_key(
+                    model, system_prompt, user_prompt,
+                    "generate" if skip_chat_api else "chat", repr(temperature), "stop" if stop_after_json else "full",
+                    format_key, base64_image
+                )
+                cached_response = load_cached_response(cache_key)
+                if cached_response:
+                    logger.info(f"Response cache hit for model {model}")
+                    return cached_response
+            
             # Use chat API by default (more reliable for multimodal)
             if not skip_chat_api:
                 messages = [
@@ -533,223 +803,28 @@ class OllamaClient:
                         "content": system_prompt
                     })
                 
-                return self.chat(model, messages, temperature, max_retries, request_timeout)
+                response = self.chat(model, messages, temperature, max_retries, request_timeout, stop_after_json,
+                                     response_format=response_format)
             else:
                 # Fallback to generate API
                 prompt = f"{user_prompt or 'Analyze this image and provide detailed keywords.'}\n"
                 prompt += f"![Image](data:image/jpeg;base64,{base64_image})"
                 
-                return self.generate(model, prompt, system_prompt, temperature, max_retries, request_timeout)
-        except Exception as e:
-            logger.error(f"Error generating with image: {str(e)}")
-            return None
-    
-    def extract_json_from_response(self, response_text):
-        """Extract JSON from response text"""
-        try:
-            # Try to find JSON block in markdown format
-            if "```json" in response_text:
-                # Extract JSON from markdown code block
-                start = response_text.find("```json") + 7
-                end = response_text.find("```", start)
-                if end != -1:
-                    json_str = response_text[start:end].strip()
-                    return json.loads(json_str)
-            elif "```" in response_text:
-                # Try generic code block
-                start = response_text.find("```") + 3
-                end = response_text.find("```", start)
-                if end != -1:
-                    json_str = response_text[start:end].strip()
-                    return json.loads(json_str)
-            
-            # Try to find JSON directly
-            start = response_text.find('{')
-            end = response_text.rfind('}')
-            if start != -1 and end != -1 and end > start:
-                json_str = response_text[start:end+1]
-                return json.loads(json_str)
-            
-            # If all else fails, try to parse the entire response
-            return json.loads(response_text)
-        except Exception as e:
-            logger.error(f"Error extracting JSON from response: {str(e)}")
-            return None
-    
-    def _process_raw_image(self, image_path):
-        """Process RAW image and return base64 data"""
-        try:
-            if RAWPY_AVAILABLE:
-                try:
-                    logger.info(f"Processing RAW file with rawpy: {image_path}")
-                    import rawpy
-                    with rawpy.imread(image_path) as raw:
-                        rgb = raw.postprocess(use_camera_wb=True, half_size=True, no_auto_bright=False, output_bps=8)
-                        img = Image.fromarray(rgb)
-                        
-                        # Resize if necessary
-                        max_size = 512
-                        width, height = img.size
-                        if max(width, height) > max_size:
-                            if width > height:
-                                new_width = max_size
-                                new_height = int(height * (max_size / width))
-                            else:
-                                new_height = max_size
-                                new_width = int(width * (max_size / height))
-                            img = img.resize((new_width, new_height), Image.LANCZOS)
-                        
-                        # Save to temporary file
-                        temp_image_path = os.path.join(tempfile.gettempdir(), f"temp_raw_{os.path.basename(image_path)}.jpg")
-                        img.save(temp_image_path, "JPEG", quality=85)
-                        
-                        # Read optimized image
-                        with open(temp_image_path, "rb") as image_file:
-                            image_data = base64.b64encode(image_file.read()).decode('utf-8')
-                        
-                        # Clean up temporary file
-                        try:
-                            os.remove(temp_image_path)
-                        except:
-                            pass
-                        
-                        return image_data
-                except Exception as e:
-                    logger.warning(f"Error processing RAW with rawpy: {str(e)}, reading directly")
+                response = self.generate(model, prompt, system_prompt, temperature, max_retries, request_timeout, stop_after_json,
+                                         response_format=response_format)
             
-            # Fallback: read RAW file directly
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            logger.error(f"Error reading RAW file: {str(e)}")
-            return None
-    
-    def _process_standard_image(self, image_path):
-        """Process standard image and return base64 data"""
-        temp_image_path = None
-        try:
-            with Image.open(image_path) as img:
-                max_size = 512
-                width, height = img.size
-                if max(width, height) > max_size:
-                    if width > height:
-                        new_width = max_size
-                        new_height = int(height * (max_size / width))
-                    else:
-                        new_height = max_size
-                        new_width = int(width * (max_size / height))
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-                    
-                    # Convert to RGB if needed
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Save to temporary file with reduced quality
-                    temp_image_path = os.path.join(tempfile.gettempdir(), f"temp_send_{os.path.basename(image_path)}")
-                    img.save(temp_image_path, "JPEG", quality=85)
-                    image_path = temp_image_path
-            
-            # Read the image file
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            # Clean up temporary file if created
-            if temp_image_path and os.path.exists(temp_image_path):
-                try:
-                    os.remove(temp_image_path)
-                except:
-                    pass
+            # Ne mettre en cache qu'une réponse dont l'objet JSON est valide : une réponse tronquée serait resservie indéfiniment
+            if response and cache_key:
+                if _has_valid_json_object(response):
+                    save_cached_response(cache_key, response)
+                else:
+                    logger.warning("Response is not valid JSON, not cached")
             
-            return image_data
+            return response
         except Exception as e:
-            logger.error(f"Error processing image: {str(e)}")
+            logger.error(f"Error generating with image: {str(e)}")
             return None
     
-    def _clean_response(self, response_text):
-        """Clean the response to extract JSON"""
-        response_text = response_text.strip()
-        
-        # Check for code blocks - fixed escape sequences
-        if "```json" in response_text:
-            # Extract content between ```json and ```
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            if end != -1:
-                return response_text[start:end].strip()
-        elif "```" in response_text:
-            # Extract content between ``` and ```
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            if end != -1:
-                return response_text[start:end].strip()
-        
-        # If we have a response with markdown bullet points, try to convert to JSON
-        if "**Keywords:**" in response_text or "*   **" in response_text:
-            logger.info("Detected markdown response, attempting to convert to JSON")
-            try:
-                # Create a basic JSON structure
-                result = {
-                    "subjects": [],
-                    "objects": [],
-                    "scene": ["Description extracted from markdown response"],
-                    "people": [],
-                    "lighting": [],
-                    "colors": [],
-                    "mood": [],
-                    "technical": []
-                }
-                
-                # Extract bullet points
-                lines = response_text.split('\n')
-                current_category = "subjects"  # Default category
-                
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # Check for category headers
-                    if "person" in line.lower() or "people" in line.lower():
-                        current_category = "people"
-                    elif "object" in line.lower():
-                        current_category = "objects"
-                    elif "light" in line.lower():
-                        current_category = "lighting"
-                    elif "color" in line.lower():
-                        current_category = "colors"
-                    elif "mood" in line.lower():
-                        current_category = "mood"
-                    elif "technical" in line.lower():
-                        current_category = "technical"
-                    elif "scene" in line.lower() or "description" in line.lower():
-                        current_category = "scene"
-                    
-                    # Extract keywords from bullet points
-                    if line.startswith("*") or line.startswith("-"):
-                        # Clean up the bullet point
-                        keyword = line.lstrip("*- ")
-                        # Remove bold markdown if present
-                        keyword = keyword.replace("**", "")
-                        # Remove any trailing colons
-                        if ":" in keyword:
-                            parts = keyword.split(":", 1)
-                            if len(parts) == 2 and parts[1].strip():
-                                # If there's content after the colon, keep both parts
-                                keyword = f"{parts[0].strip()}:{parts[1].strip()}"
-                            else:
-                                # Otherwise just keep the part before the colon
-                                keyword = parts[0].strip()
-                        
-                        if keyword:
-                            result[current_category].append(keyword)
-                
-                return json.dumps(result)
-            except Exception as e:
-                logger.error(f"Error converting markdown to JSON: {str(e)}")
-        
-        # If no JSON found, return the original text
-        return response_text
-    
     def force_balanced_usage(self):
         """Forcer l'utilisation équilibrée de toutes les instances"""
         # Réinitialiser les statistiques de toutes les instances
@@ -47,161 +47,166 @@ def get_system_font():
             return font_name
     return 'TkFixedFont'
 
-def apply_theme(root):
-    """Appliquer le thème personnalisé"""
-    style = ttk.Style()
-    style.theme_create("RetroGaming", parent="alt", settings={
-        # Configuration générale
-        ".": {
-            "configure": {
-                "background": COLORS['bg'],
-                "foreground": COLORS['fg'],
-                "fieldbackground": COLORS['input_bg'],
-                "troughcolor": COLORS['input_bg'],
-                "selectbackground": COLORS['accent'],
-                "selectforeground": COLORS['bg'],
-                "borderwidth": 0
-            }
-        },
-        
-        # Boutons
-        "TButton": {
-            "configure": {
-                "background": COLORS['button_bg'],
-                "foreground": COLORS['fg'],
-                "padding": [12, 6],
-                "borderwidth": 3,
-                "relief": "raised",
-                "highlightthickness": 2,
-                "highlightcolor": COLORS['accent'],
-                "anchor": "center"
-            },
-            "map": {
-                "background": [
-                    ("active", COLORS['accent']),
-                    ("pressed", COLORS['accent2'])
-                ],
-                "foreground": [
-                    ("active", COLORS['bg']),
-                    ("pressed", COLORS['bg'])
-                ],
-                "relief": [
-                    ("pressed", "sunken")
-                ]
-            }
-        },
-          # Champs de saisie
-        "TEntry": {
-            "configure": {
-                "fieldbackground": COLORS['input_bg'],
-                "foreground": COLORS['fg'],
-                "padding": [5, 3],
-                "borderwidth": 2,
-                "relief": "sunken",
-                "highlightthickness": 1,
-                "highlightcolor": COLORS['accent']
-            }
-        },
-        
-        # Scrollbars
-        "Vertical.TScrollbar": {
-            "configure": {
-                "background": COLORS['button_bg'],
-                "troughcolor": COLORS['bg'],
-                "borderwidth": 1,
-                "relief": "raised"
-            },
-            "map": {
-                "background": [
-                    ("active", COLORS['accent']),
-                    ("pressed", COLORS['accent2'])
-                ]
-            }
-        },
-        
-        # Labels
-        "TLabel": {
-            "configure": {
-                "background": COLORS['bg'],
-                "foreground": COLORS['fg']
-            }
-        },
-        
-        # Frames
-        "TFrame": {
-            "configure": {
-                "background": COLORS['bg']
-            }
-        },
-        
-        # LabelFrames
-        "TLabelframe": {
-            "configure": {
-                "background": COLORS['bg'],
-                "foreground": COLORS['fg']
-            }
-        },
-        "TLabelframe.Label": {
-            "configure": {
-                "background": COLORS['bg'],
-                "foreground": COLORS['accent']
-            }
+# Réglages du thème, construits une seule fois à l'import
+_THEME_SETTINGS = {
+    # Configuration générale
+    ".": {
+        "configure": {
+            "background": COLORS['bg'],
+            "foreground": COLORS['fg'],
+            "fieldbackground": COLORS['input_bg'],
+            "troughcolor": COLORS['input_bg'],
+            "selectbackground": COLORS['accent'],
+            "selectforeground": COLORS['bg'],
+            "borderwidth": 0
+        }
+    },
+    
+    # Boutons
+    "TButton": {
+        "configure": {
+            "background": COLORS['button_bg'],
+            "foreground": COLORS['fg'],
+            "padding": [12, 6],
+            "borderwidth": 3,
+            "relief": "raised",
+            "highlightthickness": 2,
+            "highlightcolor": COLORS['accent'],
+            "anchor": "center"
         },
-          # Notebook
-        "TNotebook": {
-            "configure": {
-                "background": COLORS['bg'],
-                "tabmargins": [2, 5, 2, 0]
-            }
+        "map": {
+            "background": [
+                ("active", COLORS['accent']),
+                ("pressed", COLORS['accent2'])
+            ],
+            "foreground": [
+                ("active", COLORS['bg']),
+                ("pressed", COLORS['bg'])
+            ],
+            "relief": [
+                ("pressed", "sunken")
+            ]
+        }
+    },
+      # Champs de saisie
+    "TEntry": {
+        "configure": {
+            "fieldbackground": COLORS['input_bg'],
+            "foreground": COLORS['fg'],
+            "padding": [5, 3],
+            "borderwidth": 2,
+            "relief": "sunken",
+            "highlightthickness": 1,
+            "highlightcolor": COLORS['accent']
+        }
+    },
+    
+    # Scrollbars
+    "Vertical.TScrollbar": {
+        "configure": {
+            "background": COLORS['button_bg'],
+            "troughcolor": COLORS['bg'],
+            "borderwidth": 1,
+            "relief": "raised"
         },
-        "TNotebook.Tab": {
-            "configure": {
-                "padding": [15, 5],
-                "background": COLORS['button_bg'],
-                "foreground": COLORS['fg'],
-                "borderwidth": 2,
-                "relief": "raised"
-            },
-            "map": {
-                "background": [
-                    ("selected", COLORS['accent']),
-                    ("active", COLORS['accent2'])
-                ],
-                "foreground": [
-                    ("selected", COLORS['bg']),
-                    ("active", COLORS['bg'])
-                ],
-                "relief": [
-                    ("selected", "sunken"),
-                    ("active", "raised")
-                ]
-            }
-        },        # Barres de progression
-        "Horizontal.TProgressbar": {
-            "configure": {
-                "background": COLORS['progressbar'],
-                "troughcolor": COLORS['input_bg'],
-                "borderwidth": 2,
-                "relief": "sunken",
-                "thickness": 20  # Barre plus épaisse pour un look plus rétro
-            }
+        "map": {
+            "background": [
+                ("active", COLORS['accent']),
+                ("pressed", COLORS['accent2'])
+            ]
+        }
+    },
+    
+    # Labels
+    "TLabel": {
+        "configure": {
+            "background": COLORS['bg'],
+            "foreground": COLORS['fg']
+        }
+    },
+    
+    # Frames
+    "TFrame": {
+        "configure": {
+            "background": COLORS['bg']
+        }
+    },
+    
+    # LabelFrames
+    "TLabelframe": {
+        "configure": {
+            "background": COLORS['bg'],
+            "foreground": COLORS['fg']
+        }
+    },
+    "TLabelframe.Label": {
+        "configure": {
+            "background": COLORS['bg'],
+            "foreground": COLORS['accent']
+        }
+    },
+      # Notebook
+    "TNotebook": {
+        "configure": {
+            "background": COLORS['bg'],
+            "tabmargins": [2, 5, 2, 0]
+        }
+    },
+    "TNotebook.Tab": {
+        "configure": {
+            "padding": [15, 5],
+            "background": COLORS['button_bg'],
+            "foreground": COLORS['fg'],
+            "borderwidth": 2,
+            "relief": "raised"
         },
-        
-        # Text widgets
-        "Text": {
-            "configure": {
-                "background": COLORS['input_bg'],
-                "foreground": COLORS['fg'],
-                "insertbackground": COLORS['accent'],  # Couleur du curseur
-                "selectbackground": COLORS['accent'],
-                "selectforeground": COLORS['bg'],
-                "relief": "sunken",
-                "borderwidth": 2,
-                "padx": 5,
-                "pady": 5
-            }
+        "map": {
+            "background": [
+                ("selected", COLORS['accent']),
+                ("active", COLORS['accent2'])
+            ],
+            "foreground": [
+                ("selected", COLORS['bg']),
+                ("active", COLORS['bg'])
+            ],
+            "relief": [
+                ("selected", "sunken"),
+                ("active", "raised")
+            ]
+        }
+    },        # Barres de progression
+    "Horizontal.TProgressbar": {
+        "configure": {
+            "background": COLORS['progressbar'],
+            "troughcolor": COLORS['input_bg'],
+            "borderwidth": 2,
+            "relief": "sunken",
+            "thickness": 20  # Barre plus épaisse pour un look plus rétro
         }
-    })
+    },
+    
+    # Text widgets
+    "Text": {
+        "configure": {
+            "background": COLORS['input_bg'],
+            "foreground": COLORS['fg'],
+            "insertbackground": COLORS['accent'],  # Couleur du curseur
+            "selectbackground": COLORS['accent'],
+            "selectforeground": COLORS['bg'],
+            "relief": "sunken",
+            "borderwidth": 2,
+            "padx": 5,
+            "pady": 5
+        }
+    }
+}
+
+def apply_theme(root):
+    """Appliquer le thème personnalisé"""
+    style = ttk.Style()
+    # Le thème n'est créé qu'une fois par interpréteur Tcl : un second appel lèverait TclError
+    if "RetroGaming" not in style.theme_names():
+        style.theme_create("RetroGaming", parent="alt", settings=_THEME_SETTINGS)
     
     # Appliquer le thème
     style.theme_use("RetroGaming")    # Configurer la fenêtre principale
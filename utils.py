@@ -7,28 +7,136 @@ import os
 import re
 import json
 import base64
-import tempfile
-import shutil
+import hashlib
+import mmap
+import functools
+import io
+import threading
+import time
+import queue
+import subprocess
+import atexit
 from datetime import datetime
 from PIL import Image
 import logging
 
-from config import CACHE_DIR, RAW_EXTENSIONS, RAWPY_AVAILABLE, EXIFTOOL_AVAILABLE, logger
+from config import CACHE_DIR, RESPONSE_CACHE_MAX_ENTRIES, PREVIEW_CACHE_MAX_ENTRIES, RAW_EXTENSIONS, RAWPY_AVAILABLE, EXIFTOOL_AVAILABLE, ORJSON_AVAILABLE, PYBASE64_AVAILABLE, PIEXIF_AVAILABLE, logger
 
+if ORJSON_AVAILABLE:
+    import orjson
+if PYBASE64_AVAILABLE:
+    import pybase64
+if PIEXIF_AVAILABLE:
+    import piexif
+
+# Expressions régulières de réparation JSON, compilées une seule fois
+_RE_WS = re.compile(r'\s+')
+_RE_BRACE_GAP = re.compile(r'}\s*{')
+_RE_STR_GAP = re.compile(r'"\s*"')
+_RE_TRAIL_COMMA = re.compile(r',\s*([\]}])')
+_RE_MISSING_COMMA_STR = re.compile(r'(:\s*"[^"]*")\s*(")')
+_RE_MISSING_COMMA_NUM = re.compile(r'(:\s*\d+)\s*(")')
+_RE_MISSING_COMMA_BOOL = re.compile(r'(:\s*true|false)\s*(")')
+_RE_MISSING_COMMA_ARR = re.compile(r'(:\s*\[[^\]]*\])\s*(")')
+_RE_UNESCAPED_Q = re.compile(r'(?<=[^\\])"(?=[^,\{\}\[\]:])')
+_RE_PY_LITERAL = re.compile(r':\s*(True|False|None)\b')
+_PY_LITERALS = {'True': ': true', 'False': ': false', 'None': ': null'}
+_RE_MALFORMED_ARR = re.compile(r'(\[[^\],]*)"([^"\],]*)"([^\],]*)"')
+
+# Extraction manuelle des catégories lorsque la réparation échoue
+_RE_SUBJECTS = re.compile(r'"subjects"\s*:\s*\[(.*?)\]')
+_RE_OBJECTS = re.compile(r'"objects"\s*:\s*\[(.*?)\]')
+_RE_SCENE = re.compile(r'"scene"\s*:\s*\[(.*?)\]')
+_KEYWORD_CATEGORIES = (
+    'subjects', 'objects', 'lighting', 'colors', 'composition',
+    'mood', 'technical', 'people', 'nudity'
+)
+_LEADING_ONE_RE = re.compile(r'^1(?=\D)')
+_RE_QUOTED = re.compile(r'"([^"]*)"')
+
+def json_dumps(obj):
+    """Serialize an object to compact JSON (orjson when available)"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # orjson refuse certains types (clés non str, entiers > 64 bits) : repli sur json
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+def json_dumps_bytes(obj):
+    """Serialize an object to compact UTF-8 JSON bytes, e.g. for an HTTP request body
+    
+    Avec orjson, les octets produits sont renvoyés tels quels : pas d'aller-retour str/bytes
+    sur des corps qui contiennent une image en base64.
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_loads(data):
+    """Parse JSON from str or bytes (orjson when available)
+    
+    orjson.JSONDecodeError hérite de json.JSONDecodeError : les appelants gardent le même except.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def b64encode_str(data):
+    """Encode bytes to a base64 str (pybase64 when available)"""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
+def b64encode_file(path):
+    """Encode a file's content to a base64 str, directly from a read-only memory map
+    
+    Le contenu n'est pas copié dans un objet bytes intermédiaire (utile pour les RAW envoyés tels quels).
+    """
+    with open(path, 'rb') as f:
+        # mmap ne supporte pas les fichiers vides
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return b64encode_str(mm)
+
+@functools.lru_cache(maxsize=4096)
 def _get_cache_key(image_path):
-    """Generate a cache key for an image path"""
-    return base64.b64encode(image_path.encode()).decode('utf-8')
+    """Generate a cache key for an image path (empreinte courte et sûre pour un nom de fichier)"""
+    return hashlib.blake2b(image_path.encode('utf-8'), digest_size=16).hexdigest()
+
+# Ensemble en mémoire des clés présentes dans CACHE_DIR, chargé au premier accès
+_cache_keys = None
+_cache_keys_lock = threading.Lock()
+
+def _get_cache_keys():
+    """Retourner l'ensemble des clés du cache, en parcourant CACHE_DIR une seule fois"""
+    global _cache_keys
+    if _cache_keys is None:
+        with _cache_keys_lock:
+            if _cache_keys is None:
+                keys = set()
+                try:
+                    with os.scandir(CACHE_DIR) as it:
+                        for entry in it:
+                            if entry.is_file(follow_symlinks=False):
+                                keys.add(entry.name)
+                except OSError as e:
+                    logger.warning(f"Error scanning cache directory: {str(e)}")
+                _cache_keys = keys
+    return _cache_keys
 
 def _is_in_cache(image_path, force_processing=False):
     """Check if an image is in the cache"""
     if force_processing:
         return False
     
-    cache_key = _get_cache_key(image_path)
-    cache_file = os.path.join(CACHE_DIR, cache_key)
-    
-    # Check if cache file exists and log the result
-    is_cached = os.path.exists(cache_file)
+    # Recherche O(1) dans l'ensemble en mémoire, sans appel système
+    is_cached = _get_cache_key(image_path) in _get_cache_keys()
     if is_cached:
         logger.info(f"Cache hit for {image_path}")
     
@@ -37,50 +145,328 @@ def _is_in_cache(image_path, force_processing=False):
 def _add_to_cache(image_path):
     """Add an image to the cache"""
     cache_key = _get_cache_key(image_path)
+    keys = _get_cache_keys()
+    # Image déjà marquée (retraitement forcé, XMP déjà présent) : pas de réécriture du fichier
+    if cache_key in keys:
+        return
     cache_file = os.path.join(CACHE_DIR, cache_key)
     with open(cache_file, 'w') as f:
         f.write(datetime.now().isoformat())
+    # set.add est atomique sous le GIL ; le verrou ne protège que le chargement et le vidage de l'ensemble
+    keys.add(cache_key)
 
 def clear_cache():
     """Clear the cache"""
+    global _cache_keys
     try:
-        for file in os.listdir(CACHE_DIR):
-            file_path = os.path.join(CACHE_DIR, file)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
+        with _cache_keys_lock:
+            # DirEntry réutilise le type de fichier fourni par le parcours du répertoire
+            with os.scandir(CACHE_DIR) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            # Déjà supprimé (éviction ou écriture atomique concurrente) : rien à faire
+                            pass
+            _cache_keys = set()
         logger.info("Cache cleared successfully")
         return True
     except Exception as e:
         logger.error(f"Error clearing cache: {str(e)}")
+        with _cache_keys_lock:
+            _cache_keys = None
         return False
 
-def has_keywords_in_xmp(xmp_path):
-    """Check if XMP file has keywords"""
+def cache_stats():
+    """Statistiques du cache des images traitées : nombre d'entrées et efficacité du LRU des clés
+    
+    Les fichiers d'une ancienne version (clés en base64) sont comptés jusqu'au prochain clear_cache().
+    """
+    keys = _get_cache_keys()
+    key_info = _get_cache_key.cache_info()
+    return {
+        'processed_images': sum(1 for key in keys if not key.startswith(('response_', 'preview_'))),
+        'key_hits': key_info.hits,
+        'key_misses': key_info.misses,
+        'key_currsize': key_info.currsize,
+    }
+
+# Nombre de réponses écrites depuis le démarrage, pour déclencher l'éviction périodiquement
+_response_cache_writes = 0
+
+def _response_cache_path(key):
+    """Chemin du fichier de cache d'une réponse Ollama"""
+    return os.path.join(CACHE_DIR, f"response_{key}.json")
+
+def get_response_cache_key(*parts):
+    """Clé de cache d'une réponse Ollama : empreinte BLAKE2b du modèle, des prompts et de l'image"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is None:
+            part = ''
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def load_cached_response(key):
+    """Retourner la réponse mise en cache pour cette clé, ou None"""
+    path = _response_cache_path(key)
     try:
-        if not os.path.exists(xmp_path):
-            return False
-        
-        with open(xmp_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Check for keywords
-        if '<dc:subject>' in content and '<rdf:li>' in content:
-            return True
+        with open(path, 'r', encoding='utf-8') as f:
+            response = f.read()
+        # Rafraîchir la date pour que l'éviction retire les réponses les moins récemment utilisées
+        os.utime(path)
+        return response
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Error reading cached response: {str(e)}")
+        return None
+
+def save_cached_response(key, response):
+    """Enregistrer une réponse Ollama dans le cache disque"""
+    global _response_cache_writes
+    path = _response_cache_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(response)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Error caching response: {str(e)}")
+        return
+    
+    _response_cache_writes += 1
+    if _response_cache_writes % 100 == 0:
+        _evict_response_cache()
+
+def _evict_cache_files(prefix, max_entries):
+    """Supprimer les fichiers de cache prefix* les plus anciens au-delà de max_entries"""
+    try:
+        entries = []
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if entry.name.startswith(prefix) and entry.is_file(follow_symlinks=False):
+                    entries.append((entry.stat().st_mtime, entry.path))
         
-        # Check for Lightroom hierarchical keywords
-        if '<lr:hierarchicalSubject>' in content and '<rdf:li>' in content:
-            return True
+        if len(entries) <= max_entries:
+            return
         
+        entries.sort()
+        for _, path in entries[:len(entries) - max_entries]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        logger.info(f"Cache '{prefix}*' trimmed to {max_entries} entries")
+    except OSError as e:
+        logger.warning(f"Error trimming cache '{prefix}*': {str(e)}")
+
+def _evict_response_cache(max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+    """Supprimer les réponses les plus anciennes au-delà de max_entries"""
+    _evict_cache_files('response_', max_entries)
+
+# Nombre d'aperçus écrits depuis le démarrage, pour déclencher l'éviction périodiquement
+_preview_cache_writes = 0
+
+def get_preview_cache_key(image_path, max_size):
+    """Clé de cache de l'aperçu réduit d'une image : chemin, taille et date de modification du fichier
+    
+    Retourne None si le fichier ne peut pas être lu.
+    """
+    try:
+        st = os.stat(image_path)
+    except OSError:
+        return None
+    return get_response_cache_key(image_path, str(st.st_mtime_ns), str(st.st_size), str(max_size))
+
+def _preview_cache_path(key):
+    """Chemin du fichier de cache d'un aperçu réduit"""
+    return os.path.join(CACHE_DIR, f"preview_{key}.jpg")
+
+def load_cached_preview(key):
+    """Retourner les octets JPEG de l'aperçu mis en cache pour cette clé, ou None"""
+    path = _preview_cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Rafraîchir la date pour que l'éviction retire les aperçus les moins récemment utilisés
+        os.utime(path)
+        return data
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Error reading cached preview: {str(e)}")
+        return None
+
+def save_cached_preview(key, data):
+    """Enregistrer un aperçu réduit (octets JPEG) dans le cache disque"""
+    global _preview_cache_writes
+    path = _preview_cache_path(key)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Error caching preview: {str(e)}")
+        return
+    
+    _preview_cache_writes += 1
+    if _preview_cache_writes % 100 == 0:
+        _evict_cache_files('preview_', PREVIEW_CACHE_MAX_ENTRIES)
+
+def has_keywords_in_xmp(xmp_path):
+    """Check if XMP file has keywords
+    
+    Le résultat est mémorisé par (chemin, date de modification, taille) : un nouveau parcours du
+    dossier ne coûte qu'un stat par sidecar, et un XMP modifié est relu.
+    """
+    try:
+        # Pas de XMP : cas courant, détecté par le stat lui-même (pas de test d'existence préalable)
+        st = os.stat(xmp_path)
+    except FileNotFoundError:
         return False
+    except OSError as e:
+        logger.warning(f"Error checking keywords in {xmp_path}: {str(e)}")
+        return False
+    # mmap ne supporte pas les fichiers vides
+    if st.st_size == 0:
+        return False
+    try:
+        return _xmp_has_keywords(xmp_path, st.st_mtime_ns, st.st_size)
     except Exception as e:
+        # Les exceptions ne sont pas mémorisées par lru_cache : le fichier sera relu au prochain appel
         logger.warning(f"Error checking keywords in {xmp_path}: {str(e)}")
         return False
 
+@functools.lru_cache(maxsize=10000)
+def _xmp_has_keywords(xmp_path, mtime_ns, size):
+    """Chercher des mots-clés dans un XMP non vide (mtime_ns et size ne servent qu'à la clé du cache)"""
+    with open(xmp_path, 'rb') as f:
+        # Recherche directe dans les octets mappés, sans lire ni décoder tout le fichier.
+        # Seules les pages touchées par la recherche sont lues : on s'arrête au premier élément
+        # de liste qui suit la balise de mots-clés, sans parcourir le reste du fichier.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Check for keywords, then Lightroom hierarchical keywords
+            pos = mm.find(b'<dc:subject>')
+            if pos == -1:
+                pos = mm.find(b'<lr:hierarchicalSubject>')
+            return pos != -1 and mm.find(b'<rdf:li>', pos) != -1
+
+_JSON_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+_JSON_NUMBER_CHARS = frozenset('+-0123456789.eE')
+
+def _repair_json_scan(s):
+    """Réparer en une seule passe les défauts JSON courants
+    
+    Hors des chaînes : supprime les blancs, convertit True/False/None, retire les virgules
+    finales et ajoute les virgules manquantes entre deux valeurs. Dans les chaînes, les
+    suites de blancs (dont les retours à la ligne) sont réduites à une espace.
+    """
+    out = []
+    append = out.append
+    n = len(s)
+    i = 0
+    after_value = False    # le dernier élément émis termine une valeur
+    pending_comma = False  # virgule lue, émise seulement si une valeur suit
+    
+    while i < n:
+        c = s[i]
+        
+        if c in ' \t\r\n':
+            i += 1
+            continue
+        
+        if c == ',':
+            if after_value:
+                pending_comma = True
+                after_value = False
+            i += 1
+            continue
+        
+        if c == ']' or c == '}':
+            # Une virgule en attente devant une fermeture est une virgule finale : on l'ignore
+            pending_comma = False
+            append(c)
+            after_value = True
+            i += 1
+            continue
+        
+        if c == ':':
+            pending_comma = False
+            append(c)
+            after_value = False
+            i += 1
+            continue
+        
+        # Début d'une valeur (ou d'une clé) : ajouter la virgule lue ou manquante
+        if c == '"' or c == '{' or c == '[' or c in _JSON_NUMBER_CHARS or c.isalpha():
+            if pending_comma or after_value:
+                append(',')
+            pending_comma = False
+        
+        if c == '"':
+            # Chercher le guillemet fermant non échappé
+            j = i + 1
+            while True:
+                j = s.find('"', j)
+                if j == -1:
+                    j = n
+                    break
+                k = j - 1
+                while s[k] == '\\':
+                    k -= 1
+                if (j - 1 - k) % 2 == 0:
+                    break
+                j += 1
+            append('"')
+            append(_RE_WS.sub(' ', s[i + 1:j]))
+            append('"')
+            after_value = True
+            i = j + 1
+        elif c == '{' or c == '[':
+            append(c)
+            after_value = False
+            i += 1
+        elif c in _JSON_NUMBER_CHARS:
+            j = i + 1
+            while j < n and s[j] in _JSON_NUMBER_CHARS:
+                j += 1
+            append(s[i:j])
+            after_value = True
+            i = j
+        elif c.isalpha():
+            j = i + 1
+            while j < n and (s[j].isalnum() or s[j] == '_'):
+                j += 1
+            word = s[i:j]
+            append(_JSON_LITERALS.get(word, word))
+            after_value = True
+            i = j
+        else:
+            append(c)
+            i += 1
+    
+    return ''.join(out)
+
 def clean_and_repair_json(json_str):
     """Clean and attempt to repair a potentially malformed JSON"""
     try:
+        # Chemin rapide : la réponse est déjà un objet JSON valide, aucune réparation nécessaire
+        stripped = json_str.strip()
+        if stripped.startswith('{') and stripped.endswith('}'):
+            try:
+                return json_loads(stripped)
+            except json.JSONDecodeError:
+                pass
+        
         # Log the raw JSON string for debugging
-        logger.info(f"Raw JSON before cleaning: {json_str[:200]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Raw JSON before cleaning: {json_str[:200]}...")
         
         # Find JSON in the string
         start_idx = json_str.find('{')
@@ -88,71 +474,76 @@ def clean_and_repair_json(json_str):
         
         if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
             json_str = json_str[start_idx:end_idx+1]
-            json_str = re.sub(r'\s+', ' ', json_str)
             
+            # Objet valide entouré de texte (préambule, bloc markdown) : pas de réparation nécessaire
+            if json_str != stripped:
+                try:
+                    return json_loads(json_str)
+                except json.JSONDecodeError:
+                    pass
+            
+            # Réparation des défauts courants en une seule passe
             try:
-                return json.loads(json_str)
+                return json_loads(_repair_json_scan(json_str))
             except json.JSONDecodeError as e:
                 logger.warning(f"JSON decode error: {str(e)}")
                 
+                # Dernier recours : réparations heuristiques par expressions régulières
+                json_str = _RE_WS.sub(' ', json_str)
+                
                 # Basic repair attempts
                 # 1. Replace missing commas between braces
-                json_str = re.sub(r'}\s*{', '},{', json_str)
+                json_str = _RE_BRACE_GAP.sub('},{', json_str)
                 
                 # 2. Add missing commas after strings
-                json_str = re.sub(r'"\s*"', '","', json_str)
-                
-                # 3. Fix trailing commas in lists
-                json_str = re.sub(r',\s*]', ']', json_str)
+                json_str = _RE_STR_GAP.sub('","', json_str)
                 
-                # 4. Fix trailing commas in objects
-                json_str = re.sub(r',\s*}', '}', json_str)
+                # 3-4. Fix trailing commas in lists and objects (une seule passe)
+                json_str = _RE_TRAIL_COMMA.sub(r'\1', json_str)
                 
                 # 5. Add missing commas between elements (common issue)
-                json_str = re.sub(r'(:\s*"[^"]*")\s*(")', r'\1,\2', json_str)
-                json_str = re.sub(r'(:\s*\d+)\s*(")', r'\1,\2', json_str)
-                json_str = re.sub(r'(:\s*true|false)\s*(")', r'\1,\2', json_str)
-                json_str = re.sub(r'(:\s*\[[^\]]*\])\s*(")', r'\1,\2', json_str)
+                json_str = _RE_MISSING_COMMA_STR.sub(r'\1,\2', json_str)
+                json_str = _RE_MISSING_COMMA_NUM.sub(r'\1,\2', json_str)
+                json_str = _RE_MISSING_COMMA_BOOL.sub(r'\1,\2', json_str)
+                json_str = _RE_MISSING_COMMA_ARR.sub(r'\1,\2', json_str)
                 
                 # 6. Fix unescaped quotes in strings
-                json_str = re.sub(r'(?<=[^\\])"(?=[^,\{\}\[\]:])', r'\"', json_str)
+                json_str = _RE_UNESCAPED_Q.sub(r'\"', json_str)
                 
-                # 7. Fix boolean and null values
-                json_str = re.sub(r':\s*True', r': true', json_str)
-                json_str = re.sub(r':\s*False', r': false', json_str)
-                json_str = re.sub(r':\s*None', r': null', json_str)
+                # 7. Fix boolean and null values (True/False/None Python, une seule passe)
+                json_str = _RE_PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group(1)], json_str)
                 
                 # 8. Fix malformed arrays
-                json_str = re.sub(r'(\[[^\],]*)"([^"\],]*)"([^\],]*)"', r'\1"\2","\3"', json_str)
+                json_str = _RE_MALFORMED_ARR.sub(r'\1"\2","\3"', json_str)
                 
                 # Try again
                 try:
-                    return json.loads(json_str)
+                    return json_loads(json_str)
                 except json.JSONDecodeError as e2:
                     logger.warning(f"JSON repair failed: {str(e2)}")
                     
                     # More aggressive repair attempt
                     try:
                         # Extract key values using regex
-                        subjects = re.findall(r'"subjects"\s*:\s*\[(.*?)\]', json_str)
-                        objects = re.findall(r'"objects"\s*:\s*\[(.*?)\]', json_str)
-                        scene = re.findall(r'"scene"\s*:\s*\[(.*?)\]', json_str)
+                        subjects = _RE_SUBJECTS.findall(json_str)
+                        objects = _RE_OBJECTS.findall(json_str)
+                        scene = _RE_SCENE.findall(json_str)
                         
                         result = {"subjects": [], "objects": [], "scene": ["Description not available"]}
                         
                         # Process subjects
                         if subjects:
-                            items = re.findall(r'"([^"]*)"', subjects[0])
+                            items = _RE_QUOTED.findall(subjects[0])
                             result["subjects"] = items
                         
                         # Process objects
                         if objects:
-                            items = re.findall(r'"([^"]*)"', objects[0])
+                            items = _RE_QUOTED.findall(objects[0])
                             result["objects"] = items
                         
                         # Process scene
                         if scene:
-                            items = re.findall(r'"([^"]*)"', scene[0])
+                            items = _RE_QUOTED.findall(scene[0])
                             if items:
                                 result["scene"] = items
                         
@@ -169,14 +560,30 @@ def clean_and_repair_json(json_str):
         logger.error(f"Error cleaning JSON: {str(e)}")
         return {"subjects": [], "objects": [], "scene": ["Description not available"]}
 
+# Table de dispatch par type pour les éléments de catégorie qui ne sont pas de simples chaînes
+_KEYWORD_ITEM_HANDLERS = {
+    str: lambda item: (item.strip(),),
+    dict: lambda item: [f"{key}:{value}".strip() for key, value in item.items() if isinstance(value, str)],
+}
+
+def _clean_keywords(keywords):
+    """Nettoyer une liste de mots-clés déjà strippés et retourner la liste sans doublons
+    
+    dict.fromkeys garde l'ordre du modèle : les mêmes mots-clés donnent toujours les mêmes métadonnées.
+    """
+    # Remove any "1" prefix that might have been added incorrectly
+    return list(dict.fromkeys(_LEADING_ONE_RE.sub('', kw, count=1) for kw in keywords if kw))
+
 def extract_keywords_from_json(json_data):
     """Extract keywords from JSON data generated by the model"""
     try:
-        # Log the raw JSON data for debugging
-        if isinstance(json_data, str):
-            logger.info(f"Raw JSON data before extraction: {json_data[:200]}...")
-        else:
-            logger.info(f"Raw JSON data before extraction: {str(json_data)[:200]}...")
+        # Log the raw JSON data for debugging (formaté uniquement si le niveau INFO est actif)
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
+            if isinstance(json_data, str):
+                logger.info(f"Raw JSON data before extraction: {json_data[:200]}...")
+            else:
+                logger.info(f"Raw JSON data before extraction: {str(json_data)[:200]}...")
         
         # Clean and repair JSON if it's a string
         if isinstance(json_data, str):
@@ -185,152 +592,322 @@ def extract_keywords_from_json(json_data):
             data = json_data
         
         # Extract keywords from different categories
-        keywords = []
-        scene_description = None
-        
-        # Categories to process
-        categories = [
-            'subjects', 'objects', 'lighting', 'colors', 'composition', 
-            'mood', 'technical', 'people', 'nudity'
-        ]
-        
-        # Process each category
-        for category in categories:
-            if category in data and isinstance(data[category], list):
-                for item in data[category]:
-                    if isinstance(item, str):
-                        keywords.append(item)
-                    elif isinstance(item, dict):
-                        for key, value in item.items():
-                            if isinstance(value, str):
-                                keywords.append(f"{key}:{value}")
+        raw_keywords = []
+        for items in map(data.get, _KEYWORD_CATEGORIES):
+            # Catégorie absente ou vide : une seule vérification de vérité, sans isinstance
+            if not items or items.__class__ is not list:
+                continue
+            try:
+                # Cas courant : la catégorie ne contient que des chaînes
+                raw_keywords.extend([item.strip() for item in items])
+            except AttributeError:
+                # Cas minoritaire : éléments non textuels, traités par type via la table de dispatch
+                for item in items:
+                    handler = _KEYWORD_ITEM_HANDLERS.get(item.__class__)
+                    if handler:
+                        raw_keywords.extend(handler(item))
         
         # Scene (add as description)
-        if 'scene' in data:
-            if isinstance(data['scene'], list) and data['scene']:
-                scene_description = data['scene'][0]
-            elif isinstance(data['scene'], str):
-                scene_description = data['scene']
+        scene_description = None
+        scene = data.get('scene')
+        if isinstance(scene, list) and scene:
+            scene_description = scene[0]
+        elif isinstance(scene, str):
+            scene_description = scene
         
         # Clean keywords and remove duplicates
-        cleaned_keywords = []
-        for kw in keywords:
-            if isinstance(kw, str):
-                kw = kw.strip()
-                if kw:
-                    # Remove any "1" prefix that might have been added incorrectly
-                    if kw.startswith("1") and len(kw) > 1 and not kw[1].isdigit():
-                        kw = kw[1:]
-                    cleaned_keywords.append(kw)
+        cleaned_keywords = _clean_keywords(raw_keywords)
         
         # Log the extracted keywords for debugging
-        logger.info(f"Extracted keywords: {cleaned_keywords[:10]}...")
-        logger.info(f"Extracted {len(cleaned_keywords)} unique keywords and scene description: {scene_description[:50] if scene_description else 'None'}...")
+        if log_info:
+            logger.info(f"Extracted keywords: {cleaned_keywords[:10]}...")
+            logger.info(f"Extracted {len(cleaned_keywords)} unique keywords and scene description: {scene_description[:50] if scene_description else 'None'}...")
         
-        return list(set(cleaned_keywords)), scene_description
+        return cleaned_keywords, scene_description
     except Exception as e:
         logger.error(f"Error extracting keywords from JSON: {str(e)}")
         return [], None
 
+def _downscale(img, max_size=512):
+    """Réduire l'image en place pour que son plus grand côté ne dépasse pas max_size
+    
+    thumbnail() calcule les proportions en C et profite du rééchantillonnage vectorisé de Pillow-SIMD s'il est installé.
+    """
+    if max(img.size) > max_size:
+        # JPEG pas encore décodé : libjpeg décode directement à l'échelle 1/2 à 1/8 et en RGB
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_size * 2, max_size * 2))
+        # reducing_gap : réduction préalable par blocs (box) puis BILINEAR sur un raster déjà petit ;
+        # à 512 px pour un modèle de vision, LANCZOS n'apporte rien de visible et coûte un noyau plus large
+        img.thumbnail((max_size, max_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return img
+
+def _postprocess_raw(raw):
+    """Développer un RAW ouvert par rawpy avec des réglages rapides, suffisants pour une vignette
+    
+    Le dématriçage linéaire est bien plus rapide que AHD (défaut de LibRaw) et la différence
+    disparaît après la réduction à 512 px.
+    """
+    import rawpy
+    return raw.postprocess(
+        use_camera_wb=True,
+        half_size=True,
+        no_auto_bright=False,
+        output_bps=8,
+        demosaic_algorithm=rawpy.DemosaicAlgorithm.LINEAR,
+        four_color_rgb=False,
+        fbdd_noise_reduction=rawpy.FBDDNoiseReductionMode.Off
+    )
+
+# Orientation LibRaw (raw.sizes.flip) -> rotation à appliquer à l'aperçu embarqué
+_RAW_FLIP_TRANSPOSE = {
+    3: Image.Transpose.ROTATE_180,
+    5: Image.Transpose.ROTATE_90,
+    6: Image.Transpose.ROTATE_270,
+}
+
+def _raw_to_thumbnail(raw, max_size=512):
+    """Obtenir une image RGB d'au plus max_size px à partir d'un RAW ouvert par rawpy
+    
+    L'aperçu JPEG embarqué par le boîtier est utilisé lorsqu'il couvre max_size : il se décode
+    en quelques millisecondes, sans dématriçage. Sinon le RAW est développé par _postprocess_raw.
+    """
+    import rawpy
+    try:
+        thumb = raw.extract_thumb()
+    except Exception:
+        # Pas d'aperçu ou format non pris en charge (LibRawNoThumbnailError, LibRawUnsupportedThumbnailError)
+        thumb = None
+    
+    if thumb is not None and thumb.format == rawpy.ThumbFormat.JPEG:
+        try:
+            img = Image.open(io.BytesIO(thumb.data))
+            if max(img.size) >= max_size:
+                _downscale(img, max_size)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                # L'aperçu n'est pas pivoté par LibRaw, contrairement au développement
+                transpose = _RAW_FLIP_TRANSPOSE.get(raw.sizes.flip)
+                return img.transpose(transpose) if transpose is not None else img
+        except Exception as e:
+            logger.warning(f"Unusable embedded RAW preview, developing RAW instead: {str(e)}")
+    
+    # fromarray copie forcément : Pillow stocke le RGB sur 4 octets par pixel, aucune vue sans copie
+    # n'est possible (frombuffer(..., rgb.tobytes()) ajouterait même une copie). Le tableau numpy n'est
+    # référencé que par cette expression et il est libéré dès la conversion, avant la réduction.
+    return _downscale(Image.fromarray(_postprocess_raw(raw)), max_size)
+
 def convert_raw_to_jpeg(image_path, max_size=512):
-    """Convert RAW file to JPEG for processing"""
+    """Convert RAW file to in-memory JPEG bytes for processing"""
     try:
         if not RAWPY_AVAILABLE:
             logger.warning("rawpy not available, cannot convert RAW file")
-            return None, None
-        
-        # Create temporary directory if needed
-        temp_dir = tempfile.mkdtemp()
+            return None
         
         # Process RAW file
         import rawpy
         with rawpy.imread(image_path) as raw:
-            rgb = raw.postprocess(use_camera_wb=True, half_size=True, no_auto_bright=False, output_bps=8)
-            img = Image.fromarray(rgb)
-            
-            # Resize if necessary
-            width, height = img.size
-            if max(width, height) > max_size:
-                if width > height:
-                    new_width = max_size
-                    new_height = int(height * (max_size / width))
-                else:
-                    new_height = max_size
-                    new_width = int(width * (max_size / height))
-                img = img.resize((new_width, new_height), Image.LANCZOS)
+            # Aperçu embarqué si assez grand, sinon développement rapide (déjà réduit à max_size)
+            img = _raw_to_thumbnail(raw, max_size)
             
-            # Save to temporary file
-            temp_image_path = os.path.join(temp_dir, f"temp_raw_{os.path.basename(image_path)}.jpg")
-            img.save(temp_image_path, "JPEG", quality=85)
+            # Encode to an in-memory JPEG (pas de fichier temporaire)
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=85)
             
-            logger.info(f"RAW file converted to JPEG: {temp_image_path}")
-            return temp_image_path, temp_dir
+            logger.info(f"RAW file converted to JPEG in memory: {image_path}")
+            return buffer.getvalue()
     except Exception as e:
         logger.error(f"Error converting RAW file: {str(e)}")
-        return None, None
+        return None
+
+# Délai maximal d'une commande ExifTool : au-delà (fichier corrompu...), le processus est tué
+EXIFTOOL_TIMEOUT = 30
+
+def _read_exiftool_output(stream, lines):
+    """Thread lecteur : recopier la sortie d'ExifTool ligne par ligne dans la file (None à la fin du flux)"""
+    try:
+        for line in stream:
+            lines.put(line)
+    except (OSError, ValueError):
+        pass
+    lines.put(None)
+
+class ExifToolDaemon:
+    """Processus ExifTool persistant (-stay_open) partagé par toutes les écritures de métadonnées"""
+    
+    def __init__(self):
+        self.process = None
+        self.lines = None  # File des lignes de sortie du processus courant
+        self.lock = threading.Lock()
+        self.command_id = 0
+    
+    def _start(self):
+        """Lancer ExifTool en mode -stay_open, les arguments étant lus sur stdin"""
+        self.process = subprocess.Popen(
+            ["exiftool", "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding='utf-8', errors='replace'
+        )
+        # Lecture dans un thread : un readline bloquant ne peut pas être interrompu par un délai
+        # (select ne fonctionne pas sur les tubes sous Windows)
+        self.lines = queue.Queue()
+        threading.Thread(target=_read_exiftool_output, args=(self.process.stdout, self.lines),
+                         daemon=True, name="exiftool-reader").start()
+        logger.info("ExifTool daemon started")
+    
+    def _kill(self):
+        """Tuer le processus courant (il sera relancé à la prochaine commande)"""
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.process = None
+    
+    def execute(self, args, timeout=EXIFTOOL_TIMEOUT):
+        """Exécuter une commande (un argument par ligne) et retourner la sortie d'ExifTool
+        
+        Lève TimeoutError si la commande dépasse timeout secondes ; le processus est alors tué.
+        """
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+            
+            self.command_id += 1
+            ready_marker = f"{{ready{self.command_id}}}"
+            self.process.stdin.write("\n".join(args) + f"\n-execute{self.command_id}\n")
+            self.process.stdin.flush()
+            
+            # Lire la sortie jusqu'au marqueur de fin de cette commande, dans la limite du délai
+            deadline = time.monotonic() + timeout
+            output = []
+            while True:
+                try:
+                    line = self.lines.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self._kill()
+                    raise TimeoutError(f"ExifTool did not answer within {timeout} seconds")
+                if line is None:
+                    self.process = None
+                    raise RuntimeError("ExifTool daemon terminated unexpectedly")
+                if line.strip() == ready_marker:
+                    return "".join(output)
+                output.append(line)
+    
+    def close(self):
+        """Arrêter proprement le processus ExifTool"""
+        with self.lock:
+            if self.process and self.process.poll() is None:
+                try:
+                    self.process.stdin.write("-stay_open\nFalse\n")
+                    self.process.stdin.flush()
+                    self.process.wait(timeout=5)
+                except Exception:
+                    self.process.kill()
+            self.process = None
+
+class ExifToolPool:
+    """Petit pool de processus ExifTool persistants : les écritures concurrentes ne se sérialisent pas sur un seul processus"""
+    
+    def __init__(self, size=4):
+        self.size = size
+        self.idle = queue.LifoQueue()  # Réutiliser en priorité le processus le plus récemment utilisé
+        self.daemons = []
+        self.lock = threading.Lock()
+    
+    def execute(self, args):
+        """Exécuter une commande sur un processus libre, démarré à la demande dans la limite de size"""
+        try:
+            daemon = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                if len(self.daemons) < self.size:
+                    daemon = ExifToolDaemon()
+                    self.daemons.append(daemon)
+                else:
+                    daemon = None
+            if daemon is None:
+                daemon = self.idle.get()
+        try:
+            return daemon.execute(args)
+        finally:
+            self.idle.put(daemon)
+    
+    def close(self):
+        """Arrêter tous les processus ExifTool"""
+        with self.lock:
+            for daemon in self.daemons:
+                daemon.close()
+
+# Pool partagé (taille alignée sur le pool d'écriture des métadonnées), arrêté à la sortie du programme
+_exiftool_pool = ExifToolPool(size=4)
+atexit.register(_exiftool_pool.close)
+
+_RE_EXIFTOOL_UPDATED = re.compile(r'(\d+) image files? updated')
 
 def save_jpg_metadata_with_exiftool(jpg_path, keywords, scene_description=None):
     """Save metadata to JPG file using ExifTool"""
     try:
-        # Prepare ExifTool commands
+        # Prepare ExifTool arguments (one per line: values must not contain newlines)
         commands = []
         
-        # Add IPTC keywords
+        # Add IPTC keywords (one assignment per keyword builds the list)
         if keywords:
-            # Convert keyword list to string for ExifTool
-            keywords_str = ','.join(f'"{kw}"' for kw in keywords)
-            commands.append(f'-IPTC:Keywords={keywords_str}')
-            commands.append(f'-XMP:Subject={keywords_str}')
+            for kw in keywords:
+                kw = ' '.join(kw.splitlines())
+                commands.append(f'-IPTC:Keywords={kw}')
+                commands.append(f'-XMP:Subject={kw}')
         
         # Add description if available
         if scene_description:
-            commands.append(f'-IPTC:Caption-Abstract="{scene_description}"')
-            commands.append(f'-XMP:Description="{scene_description}"')
+            scene_description = ' '.join(scene_description.splitlines())
+            commands.append(f'-IPTC:Caption-Abstract={scene_description}')
+            commands.append(f'-XMP:Description={scene_description}')
         
         if commands:
-            # Execute ExifTool
-            import subprocess
-            cmd = ["exiftool", "-overwrite_original"]
-            cmd.extend(commands)
-            cmd.append(jpg_path)
+            # Execute ExifTool through the persistent process
+            args = ["-overwrite_original"]
+            args.extend(commands)
+            args.append(jpg_path)
             
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            if result.returncode != 0:
-                logger.error(f"ExifTool error: {result.stderr}")
+            output = _exiftool_pool.execute(args)
+            updated = _RE_EXIFTOOL_UPDATED.search(output)
+            if not updated or int(updated.group(1)) == 0:
+                logger.error(f"ExifTool error: {output.strip()}")
                 return False
             
             logger.info(f"Metadata written to JPG file with ExifTool")
             return True
         return False
+    except TimeoutError as e:
+        # Processus bloqué déjà tué par le pool : ce fichier est abandonné, sans nouvelle tentative
+        logger.error(f"ExifTool timed out on {jpg_path}: {str(e)}")
+        return False
     except Exception as e:
         logger.error(f"Error writing metadata with ExifTool: {str(e)}")
         return False
 
 def save_jpg_metadata_with_pillow(jpg_path, keywords, scene_description=None):
-    """Save metadata to JPG file using Pillow (limited capabilities)"""
+    """Save metadata to JPG file without ExifTool (EXIF only, via piexif)
+    
+    piexif ne réécrit que le segment APP1 : pas de décodage ni de recompression JPEG.
+    Sans piexif, rien n'est écrit : réenregistrer l'image avec Pillow recompresserait les pixels
+    et perdrait les métadonnées existantes, les mots-clés restant dans le sidecar XMP.
+    """
+    if not PIEXIF_AVAILABLE:
+        logger.warning(f"Neither ExifTool nor piexif is available, JPG metadata not written: {jpg_path}")
+        return False
     try:
-        # Open image with Pillow
-        img = Image.open(jpg_path)
-        
-        # Pillow has limited capabilities for writing metadata
-        # Save the image with new metadata
-        img.save(jpg_path, format="JPEG", quality=85)
+        exif = piexif.load(jpg_path)
+        if scene_description:
+            exif['0th'][piexif.ImageIFD.ImageDescription] = scene_description.encode('utf-8')
+        if keywords:
+            # XPKeywords (Windows) : UTF-16LE terminé par un nul, mots-clés séparés par ';'
+            exif['0th'][piexif.ImageIFD.XPKeywords] = tuple(';'.join(keywords).encode('utf-16-le') + b'\0\0')
+        piexif.insert(piexif.dump(exif), jpg_path)
         
-        logger.info(f"Metadata written to JPG file with Pillow (limited)")
+        logger.info(f"Metadata written to JPG file with piexif (EXIF only)")
         return True
     except Exception as e:
-        logger.error(f"Error writing metadata with Pillow: {str(e)}")
+        logger.error(f"Error writing metadata with piexif: {str(e)}")
         return False
-
-def _cleanup_temp_files(temp_files):
-    """Clean up temporary files and directories"""
-    for file_type, path in temp_files:
-        try:
-            if file_type == "file" and os.path.exists(path):
-                os.remove(path)
-                logger.debug(f"Temporary file removed: {path}")
-            elif file_type == "dir" and os.path.exists(path):
-                shutil.rmtree(path)
-                logger.debug(f"Temporary directory removed: {path}")
-        except Exception as e:
-            logger.warning(f"Error cleaning up temporary {file_type}: {path} - {str(e)}")